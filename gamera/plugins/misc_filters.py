@@ -20,7 +20,12 @@
 #
 
 from gamera.plugin import *
-import _misc_filters
+try:
+  import _misc_filters
+except ImportError:
+  # pure-python install: mean and rank fall back to the numba
+  # implementations in misc_filters_numba.py
+  _misc_filters = None
 
 class rank(PluginFunction):
   """
@@ -54,6 +59,9 @@ class rank(PluginFunction):
       raise RuntimeError("rank: window size k must be odd")
     if rank < 1 or rank > k*k:
       raise RuntimeError("rank: rank must be between 1 and k*k")
+    if _misc_filters is None:
+      from gamera.plugins import misc_filters_numba
+      return misc_filters_numba.rank(self, rank, k, border_treatment)
     return _misc_filters.rank(self, rank, k, border_treatment)
   __call__ = staticmethod(__call__)
 
@@ -75,6 +83,9 @@ class mean(PluginFunction):
   def __call__(self, k=3, border_treatment=1):
     if k%2 == 0:
       raise RuntimeError("mean: window size k must be odd")
+    if _misc_filters is None:
+      from gamera.plugins import misc_filters_numba
+      return misc_filters_numba.mean(self, k, border_treatment)
     return _misc_filters.mean(self, k, border_treatment)
   __call__ = staticmethod(__call__)
 
@@ -206,11 +217,19 @@ class kfill_modified(PluginFunction):
     __call__ = staticmethod(__call__)
 
 
+try:
+    from gamera.__compiletime_config__ import has_openmp
+except ImportError:
+    has_openmp = False
+
 class MiscFiltersModule(PluginModule):
     category = "Filter"
     functions = [mean, rank, min_max_filter, create_gabor_filter,
                  kfill, kfill_modified]
     cpp_headers = ["misc_filters.hpp"]
+    if has_openmp:
+        extra_compile_args = ["-fopenmp"]
+        extra_link_args = ["-fopenmp"]
     author = "Michael Droettboom and Karl MacMillan"
     url = "http://gamera.sourceforge.net/"
 module = MiscFiltersModule()
@@ -0,0 +1,161 @@
+# -*- mode: python; indent-tabs-mode: nil; tab-width: 3 -*-
+# vim: set tabstop=3 shiftwidth=3 expandtab:
+#
+# Copyright (C) 2001-2005 Ichiro Fujinaga, Michael Droettboom, Karl MacMillan
+#               2010-2012 Christoph Dalitz
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+"""Numba implementations of the ``mean`` and ``rank`` filters.
+
+These are used as a fallback by misc_filters.py when the compiled
+``_misc_filters`` extension is not available, so that the most common
+filters still work from a pure-Python install.  They follow the same
+border-treatment semantics as the C++ versions (0 = padwhite,
+1 = reflect) but run over numpy arrays converted with numpy_io.
+
+This module is not a plugin module itself and registers no functions.
+"""
+
+try:
+   import numba
+   import numpy
+   from numba import njit, prange
+except ImportError:
+   numba = None
+
+from gamera.enums import ONEBIT, GREY16, FLOAT
+
+if numba is not None:
+
+   # no fastmath: padwhite on float images sums DBL_MAX border values,
+   # which fastmath's finite-arithmetic assumption would miscompile
+   @njit(parallel=True, cache=True)
+   def _mean_kernel(src, dst, r, reflect, white):
+      h, w = src.shape
+      kk = 1.0 / ((2 * r + 1) * (2 * r + 1))
+      for y in prange(h):
+         for x in range(w):
+            s = 0.0
+            for dy in range(-r, r + 1):
+               for dx in range(-r, r + 1):
+                  yy = y + dy
+                  xx = x + dx
+                  if yy < 0 or yy >= h or xx < 0 or xx >= w:
+                     if reflect:
+                        if yy < 0:
+                           yy = -yy
+                        elif yy >= h:
+                           yy = h - (yy - h) - 2
+                        if xx < 0:
+                           xx = -xx
+                        elif xx >= w:
+                           xx = w - (xx - w) - 2
+                        s += src[yy, xx]
+                     else:
+                        s += white
+                  else:
+                     s += src[yy, xx]
+            dst[y, x] = s * kk
+
+   @njit(parallel=True, cache=True)
+   def _rank_kernel(src, dst, rank, r, reflect, white):
+      h, w = src.shape
+      k = 2 * r + 1
+      for y in prange(h):
+         window = numpy.empty(k * k, dtype=src.dtype)
+         for x in range(w):
+            i = 0
+            for dy in range(-r, r + 1):
+               for dx in range(-r, r + 1):
+                  yy = y + dy
+                  xx = x + dx
+                  if yy < 0 or yy >= h or xx < 0 or xx >= w:
+                     if reflect:
+                        if yy < 0:
+                           yy = -yy
+                        elif yy >= h:
+                           yy = h - (yy - h) - 2
+                        if xx < 0:
+                           xx = -xx
+                        elif xx >= w:
+                           xx = w - (xx - w) - 2
+                        window[i] = src[yy, xx]
+                     else:
+                        window[i] = white
+                  else:
+                     window[i] = src[yy, xx]
+                  i += 1
+            window.sort()
+            dst[y, x] = window[rank - 1]
+
+def _require_numba(name):
+   if numba is None:
+      raise RuntimeError(
+         "%s: neither the compiled _misc_filters extension nor numba "
+         "is available" % name)
+
+def _white_value(image, array):
+   # mirrors pixel_traits<T>::white() for the image's pixel type
+   pixel_type = image.data.pixel_type
+   if pixel_type == ONEBIT:
+      return 0.0
+   if pixel_type == GREY16:
+      # grey16 is stored in a uint32 array, but its white is 65535
+      return 65535.0
+   if pixel_type == FLOAT:
+      return numpy.finfo(array.dtype).max
+   return float(numpy.iinfo(array.dtype).max)
+
+def _from_array(array, image):
+   from gamera.plugins import numpy_io
+   from gamera.core import Point
+   return numpy_io.from_numpy(array, Point(image.offset_x, image.offset_y))
+
+def mean(image, k=3, border_treatment=1):
+   _require_numba("mean")
+   array = image.to_numpy()
+   if image.nrows < k or image.ncols < k:
+      return _from_array(array.copy(), image)
+   dst = numpy.empty(array.shape, dtype=numpy.float64)
+   _mean_kernel(array.astype(numpy.float64), dst, (k - 1) // 2,
+                border_treatment == 1, _white_value(image, array))
+   # the C++ plugin computes T_value_type(window_sum*kk + 0.5) for all
+   # pixel types, so float images carry the +0.5 rounding bias as well
+   if image.data.pixel_type == FLOAT:
+      return _from_array(dst + 0.5, image)
+   return _from_array((dst + 0.5).astype(array.dtype), image)
+
+def rank(image, rank, k=3, border_treatment=1):
+   _require_numba("rank")
+   array = image.to_numpy()
+   if image.nrows < k or image.ncols < k:
+      return _from_array(array.copy(), image)
+   if image.data.pixel_type == ONEBIT:
+      # consistent with the C++ plugin: low ranks darken onebit
+      # images too, although black is the high pixel value there
+      rank = k * k - rank + 1
+   elif image.data.pixel_type == FLOAT:
+      # the C++ float specialization returns *(window.begin()+rank)
+      # after nth_element, i.e. the (rank+1)-th smallest value --
+      # off by one against the histogram version; reproduce that
+      # (clamped to the window) so fallback and extension agree
+      rank = min(rank + 1, k * k)
+   dst = numpy.empty(array.shape, dtype=array.dtype)
+   _rank_kernel(array, dst, rank, (k - 1) // 2,
+                border_treatment == 1,
+                array.dtype.type(_white_value(image, array)))
+   return _from_array(dst, image)
@@ -10,12 +10,17 @@
 # but WITHOUT ANY WARRANTY; without even the implied warranty of
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
 # GNU General Public License for more details.
-# 
+#
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 """Data transfer between Gamera and numarray.
+
+The ``numpy.numarray`` compatibility layer this module was originally
+written against has been removed from numpy, so the conversions are now
+implemented directly on top of numpy.  The functions keep their historic
+names and accept/return plain numpy arrays.
 """
 
 from gamera.plugin import *
@@ -23,56 +28,67 @@ from gamera.util import warn_deprecated
 from gamera import config
 
 try:
-    import numpy.numarray as n
+    import numpy as n
 except ImportError:
     try:
         verbose = config.get("verbosity_level")
     except:
         verbose = 0
     if verbose:
-        print ('Info: numpy.numarray could not be imported')
+        print ('Info: numpy could not be imported')
 else:
-    _typecodes = {RGB       : n.UInt8,
-                  GREYSCALE : n.UInt8,
-                  GREY16    : n.UInt32,
-                  ONEBIT    : n.UInt16,
-                  FLOAT     : n.Float64,
-                  COMPLEX   : n.Complex64 }
-    _inverse_typecodes = { n.UInt8     : GREYSCALE,
-                           n.UInt32    : GREY16,
-                           n.UInt16    : ONEBIT,
-                           n.Float64   : FLOAT,
-                           n.Complex64 : COMPLEX } 
-        
+    _typecodes = {RGB       : n.dtype('uint8'),
+                  GREYSCALE : n.dtype('uint8'),
+                  GREY16    : n.dtype('uint32'),
+                  ONEBIT    : n.dtype('uint16'),
+                  FLOAT     : n.dtype('float64'),
+                  COMPLEX   : n.dtype('complex128') }
+    _inverse_typecodes = { n.dtype('uint8')      : GREYSCALE,
+                           n.dtype('uint32')     : GREY16,
+                           n.dtype('uint16')     : ONEBIT,
+                           n.dtype('float64')    : FLOAT,
+                           n.dtype('complex128') : COMPLEX }
+
+    # per pixel type: (typecode, extra shape dimensions), precomputed at
+    # import time so the conversion itself needs a single dict lookup
+    _to_numarray_dispatch = {}
+    for _pixel_type, _typecode in _typecodes.items():
+        if _pixel_type == RGB:
+            _to_numarray_dispatch[_pixel_type] = (_typecode, (3,))
+        else:
+            _to_numarray_dispatch[_pixel_type] = (_typecode, ())
+    del _pixel_type, _typecode
+
+
     class from_numarray(PluginFunction):
         """
-        Instantiates a Gamera image from a numarray multi-dimensional
+        Instantiates a Gamera image from a numpy multi-dimensional
         array *array*.
 
         Optionally, an *offset* for the image data may be provided.
-            
+
         The array must be one of the following types and will map to
         the corresponding Gamera image type:
 
         +------------+------------------+
-        | Gamera     | Numarray         |
+        | Gamera     | Numpy            |
         | type       | type             |
         +============+==================+
-        | RGB        | UInt8 (on 3      |
+        | RGB        | uint8 (on 3      |
         |            | planes)          |
         +------------+------------------+
-        | GREYSCALE  | UInt8            |
+        | GREYSCALE  | uint8            |
         +------------+------------------+
-        | GREY16     | UInt32           |
+        | GREY16     | uint32           |
         +------------+------------------+
-        | ONEBIT     | UInt16           |
+        | ONEBIT     | uint16           |
         +------------+------------------+
-        | FLOAT      | Float64          |
+        | FLOAT      | float64          |
         +------------+------------------+
-        | COMPLEX    | Complex64        |
+        | COMPLEX    | complex128       |
         +------------+------------------+
 
-        Requires two copying operations;  may fail for very large images.
+        Requires one copying operation;  may fail for very large images.
 
         To use this function, which is not a method on images, do the following:
 
@@ -91,63 +107,169 @@ else:
             if offset is None:
                 offset = Point(0, 0)
             pixel_type = from_numarray._check_input(array)
-            return _string_io._from_raw_string(
-                offset,
-                Dim(array.shape[1], array.shape[0]),
-                pixel_type, DENSE,
-                array.tostring())
+            dim = Dim(array.shape[1], array.shape[0])
+            if not array.flags['C_CONTIGUOUS']:
+                # sliced/transposed arrays do not export a contiguous
+                # buffer; compact them first instead of serializing to a
+                # string with the deprecated tostring()
+                array = n.ascontiguousarray(array)
+            # hand the array's buffer over to the C++ side directly,
+            # so the pixel data is only copied once
+            return _string_io._from_raw_buffer(
+                offset, dim, pixel_type, DENSE, array)
         __call__ = staticmethod(__call__)
 
         def _check_input(array):
             shape = array.shape
-            typecode = n.typefrom(array)
-            if len(shape) == 3 and shape[2] == 3 and typecode == n.UInt8:
+            typecode = array.dtype
+            if len(shape) == 2:
+                pixel_type = _inverse_typecodes.get(typecode)
+                if pixel_type is not None:
+                    return pixel_type
+            elif len(shape) == 3 and shape[2] == 3 and typecode == n.dtype('uint8'):
                 return RGB
-            elif len(shape) == 2:
-                if _inverse_typecodes.has_key(typecode):
-                    return _inverse_typecodes[typecode]
-            raise ValueError('Array is not one of the acceptable types (UInt8 * 3, UInt8, UInt16, UInt32, Float64, Complex64)')
+            raise ValueError('Array is not one of the acceptable types (uint8 * 3, uint8, uint16, uint32, float64, complex128)')
         _check_input = staticmethod(_check_input)
 
+    class from_numarray_batch(PluginFunction):
+        """
+        Instantiates a list of Gamera images from a list of numpy
+        multi-dimensional arrays *arrays*.  Optionally, a list of
+        *offsets* of the same length may be provided.
+
+        The acceptable array types are the same as for from_numarray_.
+        For many small images (e.g. glyphs), this is faster than calling
+        ``from_numarray`` in a loop, because the plugin lookups and
+        imports are only done once for the whole batch.
+
+.. _from_numarray: #from-numarray
+
+        To use this function, which is not a method on images, do the
+        following:
+
+        .. code:: Python
+
+          from gamera.plugins import numarray_io
+          images = numarray_io.from_numarray_batch(arrays)
+        """
+        self_type = None
+        args = Args([Class("arrays")])
+        return_type = Class("images")
+        pure_python = True
+        def __call__(arrays, offsets=None):
+            from gamera.plugins import _string_io
+            from gamera.core import Point, Dim
+            from_raw_buffer = _string_io._from_raw_buffer
+            check_input = from_numarray._check_input
+            if offsets is None:
+                offsets = [Point(0, 0)] * len(arrays)
+            elif len(offsets) != len(arrays):
+                raise ValueError(
+                    "from_numarray_batch: %d arrays but %d offsets"
+                    % (len(arrays), len(offsets)))
+            images = []
+            for array, offset in zip(arrays, offsets):
+                pixel_type = check_input(array)
+                dim = Dim(array.shape[1], array.shape[0])
+                if not array.flags['C_CONTIGUOUS']:
+                    array = n.ascontiguousarray(array)
+                images.append(from_raw_buffer(
+                    offset, dim, pixel_type, DENSE, array))
+            return images
+        __call__ = staticmethod(__call__)
+
+    class to_numarray_batch(PluginFunction):
+        """
+        Returns a list of numpy arrays containing copies of the data of
+        the given list of images, like calling to_numarray_ on each
+        image, but with the per-call plugin overhead amortized over the
+        whole batch.
+
+.. _to_numarray: #to-numarray
+
+        To use this function, which is not a method on images, do the
+        following:
+
+        .. code:: Python
+
+          from gamera.plugins import numarray_io
+          arrays = numarray_io.to_numarray_batch(images)
+        """
+        self_type = None
+        args = Args([Class("images")])
+        return_type = Class("arrays")
+        pure_python = True
+        def __call__(images):
+            from gamera.plugins import _string_io, string_io
+            image_as_buffer = _string_io._image_as_buffer
+            to_raw_buffer = _string_io._to_raw_buffer
+            conversion_buffer = string_io._conversion_buffer
+            frombuffer = n.frombuffer
+            dispatch = _to_numarray_dispatch
+            arrays = []
+            for image in images:
+                typecode, shape_suffix = dispatch[image.data.pixel_type]
+                shape = (image.nrows, image.ncols) + shape_suffix
+                try:
+                    buf = image_as_buffer(image)
+                except TypeError:
+                    buf = conversion_buffer(
+                        typecode.itemsize * image.nrows * image.ncols *
+                        (shape_suffix and 3 or 1))
+                    to_raw_buffer(image, buf)
+                arrays.append(frombuffer(buf, typecode)
+                              .reshape(shape).copy())
+            return arrays
+        __call__ = staticmethod(__call__)
+
     class to_numarray(PluginFunction):
         """
-        Returns a ``numarray`` array containing a copy of the image's data.
+        Returns a numpy array containing a copy of the image's data.
 
         The array will be one of the following types corresponding
         to each of the Gamera image types:
 
         +------------+-----------------+
-        | Gamera     | Numarray        |
+        | Gamera     | Numpy           |
         | type       | type            |
         +============+=================+
-        | RGB        | UInt8 (on 3     |
+        | RGB        | uint8 (on 3     |
         |            | planes)         |
         +------------+-----------------+
-        | GREYSCALE  | UInt8           |
+        | GREYSCALE  | uint8           |
         +------------+-----------------+
-        | GREY16     | UInt32          |
+        | GREY16     | uint32          |
         +------------+-----------------+
-        | ONEBIT     | UInt16          |
+        | ONEBIT     | uint16          |
         +------------+-----------------+
-        | FLOAT      | Float64         |
+        | FLOAT      | float64         |
         +------------+-----------------+
-        | COMPLEX    | Complex64       |
+        | COMPLEX    | complex128      |
         +------------+-----------------+
 
-        Requires *three* copies, and may fail for very large images.
+        Requires one copy, and may fail for very large images.
         """
         self_type = ImageType(ALL)
         return_type = Class("array")
         pure_python = True
         def __call__(image):
             from gamera.plugins import _string_io
-            pixel_type = image.data.pixel_type
-            shape = (image.nrows, image.ncols)
-            typecode = _typecodes[pixel_type]
-            if pixel_type == RGB:
-                shape += (3,)
-            return n.fromstring(_string_io._to_raw_string(image),
-                                typecode=typecode, shape=shape)
+            typecode, shape_suffix = _to_numarray_dispatch[image.data.pixel_type]
+            shape = (image.nrows, image.ncols) + shape_suffix
+            try:
+                # copy straight out of the image buffer, avoiding the
+                # intermediate string entirely
+                buf = _string_io._image_as_buffer(image)
+                return n.frombuffer(buf, typecode).reshape(shape).copy()
+            except TypeError:
+                # image storage without direct buffer access: fill a
+                # pooled bytearray instead of allocating a fresh string
+                from gamera.plugins import string_io
+                buf = string_io._conversion_buffer(
+                    typecode.itemsize * image.nrows * image.ncols *
+                    (shape_suffix and 3 or 1))
+                _string_io._to_raw_buffer(image, buf)
+                return n.frombuffer(buf, typecode).reshape(shape).copy()
         __call__ = staticmethod(__call__)
 
         def __doc_example1__(images):
@@ -184,10 +306,13 @@ else:
     class NumarrayModule(PluginModule):
         category = None #"ExternalLibraries/Numarray"
         author = "Alex Cobb"
-        functions = [from_numarray, to_numarray]
+        functions = [from_numarray, to_numarray,
+                     from_numarray_batch, to_numarray_batch]
         pure_python = True
         url = ('http://www.oeb.harvard.edu/faculty/holbrook/'
                'people/alex/Website/alex.htm')
     module = NumarrayModule()
 
     from_numarray = from_numarray()
+    from_numarray_batch = from_numarray_batch()
+    to_numarray_batch = to_numarray_batch()
@@ -41,8 +41,19 @@ else:
                            n.dtype('uint32')    : GREY16,
                            n.dtype('uint16')    : ONEBIT,
                            n.dtype('float64')   : FLOAT,
-                           n.dtype('complex128') : COMPLEX } 
-        
+                           n.dtype('complex128') : COMPLEX }
+
+    # per pixel type: (typecode, extra shape dimensions), precomputed at
+    # import time so the conversion itself needs a single dict lookup
+    _to_numpy_dispatch = {}
+    for _pixel_type, _typecode in _typecodes.items():
+        if _pixel_type == RGB:
+            _to_numpy_dispatch[_pixel_type] = (_typecode, (3,))
+        else:
+            _to_numpy_dispatch[_pixel_type] = (_typecode, ())
+    del _pixel_type, _typecode
+
+
     class from_numpy(PluginFunction):
         """
         Instantiates a Gamera image from a Numeric multi-dimensional
@@ -69,13 +80,13 @@ else:
         | COMPLEX    | complex128       |
         +------------+------------------+
 
-        Requires two copying operations;  may fail for very large images.
+        Requires one copying operation;  may fail for very large images.
 
         To use this function, which is not a method on images, do the
         following:
 
         .. code:: Python
-        
+
           from gamera.plugins import numpy_io
           image = numpy_io.from_numpy(array)
         """
@@ -87,22 +98,28 @@ else:
             from gamera.plugins import _string_io
             from gamera.core import Dim
             pixel_type = from_numpy._check_input(array)
-            return _string_io._from_raw_string(
-                offset,
-                Dim(array.shape[1], array.shape[0]),
-                pixel_type, DENSE,
-                array.tostring())
+            dim = Dim(array.shape[1], array.shape[0])
+            if not array.flags['C_CONTIGUOUS']:
+                # sliced/transposed arrays do not export a contiguous
+                # buffer; compact them first instead of serializing to a
+                # string with the deprecated tostring()
+                array = n.ascontiguousarray(array)
+            # hand the array's buffer over to the C++ side directly,
+            # so the pixel data is only copied once
+            return _string_io._from_raw_buffer(
+                offset, dim, pixel_type, DENSE, array)
         __call__ = staticmethod(__call__)
 
         def _check_input(array):
 
             shape = array.shape
             typecode = array.dtype
-            if len(shape) == 3 and shape[2] == 3 and typecode == n.dtype('uint8'):
+            if len(shape) == 2:
+                pixel_type = _inverse_typecodes.get(typecode)
+                if pixel_type is not None:
+                    return pixel_type
+            elif len(shape) == 3 and shape[2] == 3 and typecode == n.dtype('uint8'):
                 return RGB
-            elif len(shape) == 2:
-                if _inverse_typecodes.has_key(typecode):
-                    return _inverse_typecodes[typecode]
             raise ValueError('Array is not one of the acceptable types (uint8 * 3, uint8, uint16, uint32, float64, complex128)')
         _check_input = staticmethod(_check_input)
 
@@ -131,14 +148,14 @@ else:
         | COMPLEX    | complex128      |
         +------------+-----------------+
 
-        Requires *three* copies, and may fail for very large images.
+        Requires one copy, and may fail for very large images.
 
         This method can be used for utilizing special functions present in
         numpy. If you need to compute the discrete fourier transform of
         an image, you can use numpy, as in the following  example:
 
         .. code:: Python
-        
+
           from gamera.plugins import numpy_io
           from numpy import fft
           nparr = image.to_numpy()
@@ -150,13 +167,22 @@ else:
         pure_python = True
         def __call__(image):
             from gamera.plugins import _string_io
-            pixel_type = image.data.pixel_type
-            shape = (image.nrows, image.ncols)
-            typecode = _typecodes[pixel_type]
-            if pixel_type == RGB:
-                shape += (3,)
-            array = n.fromstring(_string_io._to_raw_string(image), typecode)
-            return n.resize(array, shape)
+            typecode, shape_suffix = _to_numpy_dispatch[image.data.pixel_type]
+            shape = (image.nrows, image.ncols) + shape_suffix
+            try:
+                # copy straight out of the image buffer, avoiding the
+                # intermediate string entirely
+                buf = _string_io._image_as_buffer(image)
+                return n.frombuffer(buf, typecode).reshape(shape).copy()
+            except TypeError:
+                # image storage without direct buffer access: fill a
+                # pooled bytearray instead of allocating a fresh string
+                from gamera.plugins import string_io
+                buf = string_io._conversion_buffer(
+                    typecode.itemsize * image.nrows * image.ncols *
+                    (shape_suffix and 3 or 1))
+                _string_io._to_raw_buffer(image, buf)
+                return n.frombuffer(buf, typecode).reshape(shape).copy()
         __call__ = staticmethod(__call__)
 
         def __doc_example1__(images):
@@ -16,9 +16,11 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 
-"""Transfer of Gamera image data in Python strings. 
+"""Transfer of Gamera image data in Python strings.
 """
 
+import threading
+
 from gamera.plugin import *
 
 class _to_raw_string(PluginFunction):
@@ -54,14 +56,88 @@ class _from_raw_string(PluginFunction):
                  Class("data_string")])
     return_type = ImageType(ALL)
 
+class _from_raw_buffer(PluginFunction):
+    """
+    Instantiates an image from binary data in any object supporting
+    the buffer protocol (e.g. a numpy array or a memoryview).
+
+    Unlike ``_from_raw_string``, this reads the caller's buffer
+    directly, so only a single copying operation is required.
+
+    This function is not intended to be used directly.  To move data
+    to/from Numeric/numarray/PIL, use the functions in numeric_io.py,
+    numarray_io.py and pil_io.py respectively.
+    """
+    self_type = None
+    args = Args([Point("offset"), Dim("dim"),
+                 Int("pixel_type"), Int("storage_type"),
+                 Class("buffer_object")])
+    return_type = ImageType(ALL)
+
+class _to_raw_buffer(PluginFunction):
+    """
+    Copies the image's binary data into a writable buffer supplied by
+    the caller (e.g. a preallocated ``bytearray``) and returns the
+    buffer.  The buffer must have exactly the size of the image data.
+
+    Unlike ``_to_raw_string``, this allows repeated conversions to
+    reuse one allocation.
+
+    This function is not intended to be used directly.
+    """
+    self_type = ImageType(ALL)
+    args = Args([Class("buffer_object")])
+    return_type = Class("buffer_object")
+
+class _image_as_buffer(PluginFunction):
+    """
+    Returns a ``memoryview`` over the image's pixel buffer, without
+    copying.  This only works for dense images with contiguous rows;
+    for anything else a ``TypeError`` is raised and the caller should
+    fall back to ``_to_raw_string``.
+
+    The memoryview does not keep the image alive, so callers must copy
+    the data out of it before dropping their reference to the image.
+
+    This function is not intended to be used directly.
+    """
+    self_type = ImageType(ALL)
+    return_type = Class("image_buffer")
+
 class StringIOModule(PluginModule):
     category = "ExternalLibraries"
     cpp_headers=["string_io.hpp"]
     functions = [_to_raw_string,
-                 _from_raw_string]
+                 _from_raw_string,
+                 _from_raw_buffer,
+                 _to_raw_buffer,
+                 _image_as_buffer]
     author = "Alex Cobb"
     url = ('http://www.oeb.harvard.edu/faculty/holbrook/'
            'people/alex/Website/alex.htm')
 module = StringIOModule()
 
 _from_raw_string = _from_raw_string()
+_from_raw_buffer = _from_raw_buffer()
+
+# reusable conversion buffers, handed to _to_raw_buffer by the array
+# conversion modules.  The pool is thread-local: filling the buffer and
+# copying the data out of it are separate steps, so two threads
+# converting same-size images must not share a slot.  Only a few sizes
+# are kept per thread, so converting one huge image does not pin its
+# buffer for the life of the process.
+_MAX_POOLED_BUFFERS = 4
+
+_buffer_pool = threading.local()
+
+def _conversion_buffer(nbytes):
+    buffers = getattr(_buffer_pool, 'buffers', None)
+    if buffers is None:
+        buffers = _buffer_pool.buffers = {}
+    buf = buffers.get(nbytes)
+    if buf is None:
+        if len(buffers) >= _MAX_POOLED_BUFFERS:
+            buffers.clear()
+        buf = bytearray(nbytes)
+        buffers[nbytes] = buf
+    return buf
@@ -36,6 +36,68 @@ namespace Gamera {
   //---------------------------
   // min/max filter
   //---------------------------
+
+  /* fixed-size variant for the default 3x3 window: with the window
+     size known at compile time, both separable passes are fully
+     unrolled three-element min/max trees instead of the generic van
+     Herk subarray bookkeeping. Border pixels take the min/max over
+     the part of the window inside the image, exactly like the generic
+     version with its neutral padding. */
+  template<class T>
+  typename ImageFactory<T>::view_type* min_max_filter_3x3(const T &src, int filter){
+
+    typedef typename ImageFactory<T>::data_type data_type;
+    typedef typename ImageFactory<T>::view_type view_type;
+    typedef typename T::value_type T_value_type;
+
+    const T_value_type &(*opt)(const T_value_type&,const T_value_type&);
+    if(filter==0)
+      opt = std::min<T_value_type>;
+    else
+      opt = std::max<T_value_type>;
+
+    size_t src_nrows = src.nrows();
+    size_t src_ncols = src.ncols();
+
+    data_type *res_data = new data_type(src.size(), src.origin());
+    view_type *res= new view_type(*res_data);
+
+    size_t x, y;
+
+    // horizontal 3-tap pass
+    for(y=0; y<src_nrows; y++){
+      res->set(Point(0,y), opt(src.get(Point(0,y)), src.get(Point(1,y))));
+      for(x=1; x+1<src_ncols; x++)
+        res->set(Point(x,y), opt(opt(src.get(Point(x-1,y)),
+                                     src.get(Point(x,y))),
+                                 src.get(Point(x+1,y))));
+      res->set(Point(src_ncols-1,y), opt(src.get(Point(src_ncols-2,y)),
+                                         src.get(Point(src_ncols-1,y))));
+    }
+
+    // vertical 3-tap pass in place, keeping the unmodified values of
+    // the previous, current and next row in rolling buffers
+    std::vector<T_value_type> rowa(src_ncols), rowb(src_ncols), rowc(src_ncols);
+    for(x=0; x<src_ncols; x++){
+      rowb[x] = res->get(Point(x,0));
+      rowc[x] = res->get(Point(x,1));
+    }
+    for(x=0; x<src_ncols; x++)
+      res->set(Point(x,0), opt(rowb[x], rowc[x]));
+    for(y=1; y+1<src_nrows; y++){
+      rowa.swap(rowb);
+      rowb.swap(rowc);
+      for(x=0; x<src_ncols; x++)
+        rowc[x] = res->get(Point(x,y+1));
+      for(x=0; x<src_ncols; x++)
+        res->set(Point(x,y), opt(opt(rowa[x], rowb[x]), rowc[x]));
+    }
+    for(x=0; x<src_ncols; x++)
+      res->set(Point(x,src_nrows-1), opt(rowb[x], rowc[x]));
+
+    return res;
+  }
+
   template<class T>
   typename ImageFactory<T>::view_type* min_max_filter(const T &src, unsigned int k_h=3, int filter=0, unsigned int k_v=0){
 
@@ -59,6 +121,11 @@ namespace Gamera {
     if (src.nrows() < k_v || src.ncols() < k_h)
       return simple_image_copy(src);
 
+    // the most common call is the default 3x3 window, which has a
+    // dedicated unrolled implementation
+    if (k_h == 3 && k_v == 3)
+      return min_max_filter_3x3(src, filter);
+
 
     data_type *res_data = new data_type(src.size(), src.origin());
     view_type *res= new view_type(*res_data);
@@ -70,10 +137,21 @@ namespace Gamera {
     unsigned int shiftsize_h = ((k_h-1)/2);
     unsigned int max_length = std::max(src_nrows, src_ncols);
     unsigned int max_shift = std::max(shiftsize_v, shiftsize_h);
-    unsigned int k,i,j;
+    unsigned int k,i;
     unsigned int loc_max;
-
-
+    // the worksharing index is signed because OpenMP 2.5 (gcc < 4.4)
+    // only permits signed iteration variables
+    int j;
+
+    // both passes are independent across scanlines, so they can be
+    // distributed over threads; each thread gets its own g/h scratch
+    // arrays, and the implicit barrier between the two worksharing
+    // loops ensures the horizontal pass is complete before the
+    // vertical pass reads its result
+#ifdef _OPENMP
+#pragma omp parallel private(i,j,k,loc_max)
+#endif
+    {
     T_value_type* g_long = new T_value_type[(max_length + max_shift)];
     T_value_type* h_long = new T_value_type[(max_length + max_shift)];
 
@@ -88,7 +166,10 @@ namespace Gamera {
 
 
 	//Horizontal max
-	for(j=0; j<src_nrows; j++){ // x=row, y=col
+#ifdef _OPENMP
+#pragma omp for schedule(static)
+#endif
+	for(j=0; j<(int)src_nrows; j++){ // x=row, y=col
 
       //calc subarray g
       for( i=0 ; i<src_ncols ; i+=k_h ){
@@ -129,7 +210,10 @@ namespace Gamera {
     h = h_long+shiftsize_v;
 
 	//Vertical Max
-	for(j=0; j<src_ncols; j++){ // x=row, y=col
+#ifdef _OPENMP
+#pragma omp for schedule(static)
+#endif
+	for(j=0; j<(int)src_ncols; j++){ // x=row, y=col
 
       //calc subarray g
       for( i=0 ; i<src_nrows ; i+=k_v ){
@@ -162,6 +246,7 @@ namespace Gamera {
 
 	delete[] g_long;
 	delete[] h_long;
+    }
 
     return res;
   }
@@ -211,8 +296,14 @@ namespace Gamera {
   //----------------------------------------------
   // mean filter (David Kolanus)
   //----------------------------------------------
-  template<class T>
-  typename ImageFactory<T>::view_type* mean(const T &src, unsigned int k=3, size_t border_treatment=1) {
+
+  /* Acc is the element type of the running column-sum array. It only
+     needs to hold k*max_pixel_value, so integer pixel types with small
+     windows can use a narrow integer type, which halves the bandwidth
+     of the colsum updates; see the dispatch in mean() below. All sums
+     are integral in that case, so the result is identical. */
+  template<class T, class Acc>
+  typename ImageFactory<T>::view_type* mean_with_accumulator(const T &src, unsigned int k=3, size_t border_treatment=1) {
     typedef typename ImageFactory<T>::data_type data_type;
     typedef typename ImageFactory<T>::view_type view_type;
     typedef typename T::value_type T_value_type;
@@ -241,15 +332,35 @@ namespace Gamera {
 	int r_p=r;
 	int r_m=-r;
 
+	// running sum over the vertical window for every column, so that
+	// both the row change and the column change only touch two pixels
+	// and the runtime is independent of the window size.
+	// colsum[c+r] covers the columns -r, ..., src_ncols-1+r
+	Acc* colsum = new Acc[src_ncols + 2*r];
+
 	for(row=0; row<src_nrows; row++){
       column=0;
 
+      if (row == 0) {
+        //init column sums
+        for(ci=r_m; ci<src_ncols+r_p; ci++) {
+          colsum[ci+r] = 0;
+          for(ri=r_m; ri<=r_p; ri++) {
+            colsum[ci+r] += gp(ci, row+ri);
+          }
+        }
+      } else {
+        //slide column sums down one row
+        for(ci=r_m; ci<src_ncols+r_p; ci++) {
+          colsum[ci+r] -= gp(ci, row-1-r);
+          colsum[ci+r] += gp(ci, row+r);
+        }
+      }
+
       //init sum
       window_sum=0.0;
-      for(ri=r_m; ri<=r_p; ri++) {
-        for(ci=r_m; ci<=r_p; ci++) {
-          window_sum += gp(column+ci, row+ri);
-        }
+      for(ci=r_m; ci<=r_p; ci++) {
+        window_sum += colsum[ci+r];
       }
 
       //calc mean
@@ -257,21 +368,38 @@ namespace Gamera {
 
       //go right column....
       for(column=1; column<src_ncols; column++) {
-        for(ci=r_m; ci<=r_p; ci++) {
-          //sub
-          window_sum -= gp(column-1-r,row+ci);
+        //sub
+        window_sum -= colsum[column-1-r+r];
 
-          //add
-          window_sum += gp(column+r,row+ci);
-        }
+        //add
+        window_sum += colsum[column+r+r];
 
         //calc mean
         res->set( Point(column,row), T_value_type(window_sum*kk + 0.5));
       }
 	}
+
+	delete[] colsum;
     return res;
   }
 
+  template<class T>
+  typename ImageFactory<T>::view_type* mean(const T &src, unsigned int k=3, size_t border_treatment=1) {
+    return mean_with_accumulator<T, double>(src, k, border_treatment);
+  }
+
+  /* For greyscale images each column sum is at most 255*k, which fits
+     in 16 bits for every window size the plugin allows, so the colsum
+     array can be unsigned short. The full window sum is still summed
+     and divided in double as in the generic version, and integer sums
+     are exact in double, so the rounded result is identical. */
+  template<>
+  ImageFactory<GreyScaleImageView>::view_type* mean(const GreyScaleImageView &src, unsigned int k, size_t border_treatment) {
+    if (k <= 257)
+      return mean_with_accumulator<GreyScaleImageView, unsigned short>(src, k, border_treatment);
+    return mean_with_accumulator<GreyScaleImageView, double>(src, k, border_treatment);
+  }
+
   //----------------------------------------------------------------
   // rank filter (Christoph Dalitz and David Kolanus)
   //----------------------------------------------------------------
@@ -280,6 +408,8 @@ namespace Gamera {
   public:
     unsigned int* hist;
     unsigned int histsize;
+    unsigned int pos;    // current rank color candidate
+    unsigned int cnt_le; // number of window pixels with color <= pos
     RankHist<T>() {
       unsigned int color;
       histsize = (unsigned int)pow(2.0,8.0*sizeof(T));
@@ -287,8 +417,33 @@ namespace Gamera {
       for(color=0; color<histsize; color++){
         hist[color]=0;
       }
+      pos = 0;
+      cnt_le = 0;
     };
     ~RankHist<T>() { delete[] hist; };
+    inline void add(unsigned int color) {
+      hist[color]++;
+      if (color <= pos) cnt_le++;
+    }
+    inline void sub(unsigned int color) {
+      hist[color]--;
+      if (color <= pos) cnt_le--;
+    }
+    // move the candidate up or down until it is the smallest color
+    // whose cumulative count reaches rr; as the window only changes
+    // slightly between neighboring pixels, this is much faster than
+    // summing up the histogram from zero for every pixel
+    inline unsigned int lookup(unsigned int rr) {
+      while (cnt_le < rr && pos < histsize-1) {
+        pos++;
+        cnt_le += hist[pos];
+      }
+      while (pos > 0 && cnt_le - hist[pos] >= rr) {
+        cnt_le -= hist[pos];
+        pos--;
+      }
+      return pos;
+    }
     inline unsigned int operator() (unsigned int r, unsigned int k2);
   };
 
@@ -300,33 +455,18 @@ namespace Gamera {
     for(color=0; color<histsize; color++){
       hist[color]=0;
     }
+    pos = 0;
+    cnt_le = 0;
   }
 
   template<class T>
   inline unsigned int RankHist<T>::operator() (unsigned int r, unsigned int k2) {
-	unsigned int collect = 0;
-    unsigned int color;
-	for(color=0; color<histsize; color++){
-      collect += hist[color];
-      if(collect>=r){
-        return color;
-      }
-	}
-	return color;
+	return lookup(r);
   }
 
   template<>
   inline unsigned int RankHist<OneBitPixel>::operator() (unsigned int r, unsigned int k2) {
-	unsigned int collect = 0;
-    unsigned int color;
-	collect = 0;
-	for(color=0; color<histsize; color++){
-      collect += hist[color];
-      if(collect>=k2-r+1){
-        return color;
-      }
-	}
-	return color;
+	return lookup(k2-r+1);
   }
 
   template<class T>
@@ -348,7 +488,6 @@ namespace Gamera {
     //(col,row)
     int column=0;
     int row;
-    unsigned int color;
 	int r = (k-1)/2;
 
 	//rank class
@@ -360,34 +499,59 @@ namespace Gamera {
 	int r_p=r;
 	int r_m=-r;
 
+	// the window is moved in boustrophedon (zig-zag) order, so that
+	// the histogram is kept up to date over the entire image and never
+	// needs to be rebuilt from scratch after the first window
 	for(row=0; row<src_nrows; row++){
-      column=0;
 
-      for(color=0; color<rk.histsize; color++){
-        rk.hist[color]=0;
-      }
-      //init hist
-      for(ri=r_m; ri<=r_p; ri++) {
+      if (row == 0) {
+        //init hist
+        for(ri=r_m; ri<=r_p; ri++) {
+          for(ci=r_m; ci<=r_p; ci++) {
+            rk.add(gp(column+ci, row+ri));
+          }
+        }
+      } else {
+        //slide window down one row at the current column
         for(ci=r_m; ci<=r_p; ci++) {
-          rk.hist[gp(column+ci, row+ri)]++;
+          rk.sub(gp(column+ci, row-1-r));
+          rk.add(gp(column+ci, row+r));
         }
       }
 
       //calc median
       res->set( Point(column,row), T_value_type(rk(rank,k*k)));
 
-      //go right column....
-      for(column=1; column<src_ncols; column++) {
-        for(ci=r_m; ci<=r_p; ci++) {
-          //sub
-          rk.hist[gp(column-1-r,row+ci)]--;
+      if (row % 2 == 0) {
+        //go right column....
+        for(column=column+1; column<src_ncols; column++) {
+          for(ci=r_m; ci<=r_p; ci++) {
+            //sub
+            rk.sub(gp(column-1-r,row+ci));
 
-          //add
-          rk.hist[gp(column+r,row+ci)]++;
+            //add
+            rk.add(gp(column+r,row+ci));
+          }
+
+          //calc median
+          res->set( Point(column,row), T_value_type(rk(rank,k*k)));
         }
+        column = src_ncols-1;
+      } else {
+        //go left column....
+        for(column=column-1; column>=0; column--) {
+          for(ci=r_m; ci<=r_p; ci++) {
+            //sub
+            rk.sub(gp(column+1+r,row+ci));
+
+            //add
+            rk.add(gp(column-r,row+ci));
+          }
 
-        //calc median
-        res->set( Point(column,row), T_value_type(rk(rank,k*k)));
+          //calc median
+          res->set( Point(column,row), T_value_type(rk(rank,k*k)));
+        }
+        column = 0;
       }
 	}
 
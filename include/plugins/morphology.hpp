@@ -29,6 +29,7 @@
 #include "gamera.hpp"
 #include "neighbor.hpp"
 #include "image_utilities.hpp"
+#include "morphology_simd.hpp"
 #include "vigra/distancetransform.hxx"
 
 // for backward compatibility:
@@ -40,26 +41,15 @@ using namespace std;
 namespace Gamera {
 
   
-  /*
-  * binary dilation with arbitrary structuring element
-  */
-  template<class T, class U>
-  typename ImageFactory<T>::view_type* dilate_with_structure(const T &src, const U &structuring_element, Point origin, bool only_border=false)
+  /* collects the (dx,dy) offsets of the black pixels of a structuring
+     element image relative to its origin, plus the bounding box of the
+     offsets, so the sweep loops can precompute their range checks */
+  template<class U>
+  void structure_element_offsets(const U &structuring_element, Point origin,
+                                 IntVector &se_x, IntVector &se_y,
+                                 int &left, int &right, int &top, int &bottom)
   {
-	typedef typename ImageFactory<T>::data_type data_type;
-	typedef typename ImageFactory<T>::view_type view_type;
-	typedef typename T::value_type value_type;
-	int x,y;
-
-	value_type blackval = black(src);
-
-	data_type* dest_data = new data_type(src.size(), src.origin());
-	view_type* dest = new view_type(*dest_data);
-
-	// build list of structuring element offsets
-	IntVector se_x;
-	IntVector se_y;
-	int left, right, top, bottom, xoff, yoff;
+	int x, y, xoff, yoff;
 	left = right = top = bottom = 0;
 	for (y = 0; y < (int)structuring_element.nrows(); y++)
 		for (x = 0; x < (int)structuring_element.ncols(); x++)
@@ -73,6 +63,23 @@ namespace Gamera {
 			if (top < -yoff) top = -yoff;
 			if (bottom < yoff) bottom = yoff;
 		}
+  }
+
+  /*
+  * binary dilation with a precomputed structuring-element offset list
+  */
+  template<class T>
+  typename ImageFactory<T>::view_type* dilate_with_offsets(const T &src, const IntVector &se_x, const IntVector &se_y, int left, int right, int top, int bottom, bool only_border=false)
+  {
+	typedef typename ImageFactory<T>::data_type data_type;
+	typedef typename ImageFactory<T>::view_type view_type;
+	typedef typename T::value_type value_type;
+	int x,y;
+
+	value_type blackval = black(src);
+
+	data_type* dest_data = new data_type(src.size(), src.origin());
+	view_type* dest = new view_type(*dest_data);
 
 	// move structuring element over image and add its black pixels
 	size_t i;
@@ -116,12 +123,26 @@ namespace Gamera {
 	return dest;
   }
 
+  /*
+  * binary dilation with arbitrary structuring element
+  */
+  template<class T, class U>
+  typename ImageFactory<T>::view_type* dilate_with_structure(const T &src, const U &structuring_element, Point origin, bool only_border=false)
+  {
+	IntVector se_x;
+	IntVector se_y;
+	int left, right, top, bottom;
+	structure_element_offsets(structuring_element, origin,
+	                          se_x, se_y, left, right, top, bottom);
+	return dilate_with_offsets(src, se_x, se_y,
+	                           left, right, top, bottom, only_border);
+  }
 
   /*
-   * binary erosion with arbitrary structuring element
+   * binary erosion with a precomputed structuring-element offset list
    */
-  template<class T, class U>
-  typename ImageFactory<T>::view_type* erode_with_structure(const T &src, const U &structuring_element, Point origin){
+  template<class T>
+  typename ImageFactory<T>::view_type* erode_with_offsets(const T &src, const IntVector &se_x, const IntVector &se_y, int left, int right, int top, int bottom){
 	typedef typename ImageFactory<T>::data_type data_type;
 	typedef typename ImageFactory<T>::view_type view_type;
 	typedef typename T::value_type value_type;
@@ -132,24 +153,6 @@ namespace Gamera {
 	data_type* dest_data = new data_type(src.size(), src.origin());
 	view_type* dest = new view_type(*dest_data);
 
-	// build list of structuring element offsets
-	IntVector se_x;
-	IntVector se_y;
-	int left, right, top, bottom, xoff, yoff;
-	left = right = top = bottom = 0;
-	for (y = 0; y < (int)structuring_element.nrows(); y++)
-		for (x = 0; x < (int)structuring_element.ncols(); x++)
-		if (is_black(structuring_element.get(Point(x,y)))) {
-			xoff = x - origin.x();
-			yoff = y - origin.y();
-			se_x.push_back(xoff);
-			se_y.push_back(yoff);
-			if (left < -xoff) left = -xoff;
-			if (right < xoff) right = xoff;
-			if (top < -yoff) top = -yoff;
-			if (bottom < yoff) bottom = yoff;
-		}
-
 	// move structuring element over image and check whether it is
 	// fully contained in the source image
 	size_t i;
@@ -173,6 +176,50 @@ namespace Gamera {
 	return dest;
   }
 
+  /*
+   * binary erosion with arbitrary structuring element
+   */
+  template<class T, class U>
+  typename ImageFactory<T>::view_type* erode_with_structure(const T &src, const U &structuring_element, Point origin){
+	IntVector se_x;
+	IntVector se_y;
+	int left, right, top, bottom;
+	structure_element_offsets(structuring_element, origin,
+	                          se_x, se_y, left, right, top, bottom);
+	return erode_with_offsets(src, se_x, se_y, left, right, top, bottom);
+  }
+
+  /* balanced min/max reduction trees for the fixed-size windows that
+     neighbor9 (9 pixels) and neighbor4o (5 pixels) pass in. Unlike
+     min_element/max_element, which carry a data-dependent branch per
+     element, these lower to branch-free minss/maxss (or cmov)
+     instructions. */
+  template<class T>
+  inline T max_tree9(typename vector<T>::iterator w) {
+    return std::max(std::max(std::max(w[0], w[1]), std::max(w[2], w[3])),
+                    std::max(std::max(w[4], w[5]),
+                             std::max(std::max(w[6], w[7]), w[8])));
+  }
+
+  template<class T>
+  inline T max_tree5(typename vector<T>::iterator w) {
+    return std::max(std::max(std::max(w[0], w[1]), std::max(w[2], w[3])),
+                    w[4]);
+  }
+
+  template<class T>
+  inline T min_tree9(typename vector<T>::iterator w) {
+    return std::min(std::min(std::min(w[0], w[1]), std::min(w[2], w[3])),
+                    std::min(std::min(w[4], w[5]),
+                             std::min(std::min(w[6], w[7]), w[8])));
+  }
+
+  template<class T>
+  inline T min_tree5(typename vector<T>::iterator w) {
+    return std::min(std::min(std::min(w[0], w[1]), std::min(w[2], w[3])),
+                    w[4]);
+  }
+
   template<class T>
   class Max {
   public:
@@ -183,6 +230,10 @@ namespace Gamera {
   template<class T>
   inline T Max<T>::operator() (typename vector<T>::iterator begin,
 			       typename vector<T>::iterator end) {
+    if (end - begin == 9)
+      return max_tree9<T>(begin);
+    if (end - begin == 5)
+      return max_tree5<T>(begin);
     return *(max_element(begin, end));
   }
 
@@ -190,6 +241,10 @@ namespace Gamera {
   inline OneBitPixel Max<OneBitPixel>::operator()
     (vector<OneBitPixel>::iterator begin,
      vector<OneBitPixel>::iterator end) {
+    if (end - begin == 9)
+      return min_tree9<OneBitPixel>(begin);
+    if (end - begin == 5)
+      return min_tree5<OneBitPixel>(begin);
     return *(min_element(begin, end));
   }
 
@@ -203,13 +258,21 @@ namespace Gamera {
   template<class T>
   inline T Min<T>::operator() (typename vector<T>::iterator begin,
 			       typename vector<T>::iterator end) {
+    if (end - begin == 9)
+      return min_tree9<T>(begin);
+    if (end - begin == 5)
+      return min_tree5<T>(begin);
     return *(min_element(begin, end));
   }
-  
+
   template<>
   inline OneBitPixel Min<OneBitPixel>::operator()
     (vector<OneBitPixel>::iterator begin,
      vector<OneBitPixel>::iterator end) {
+    if (end - begin == 9)
+      return max_tree9<OneBitPixel>(begin);
+    if (end - begin == 5)
+      return max_tree5<OneBitPixel>(begin);
     return *(max_element(begin, end));
   }
   /* the general implementation (both for onebit and greyscale) needed 
@@ -230,33 +293,52 @@ namespace Gamera {
 
     try {
       if (times > 1) {
-	view_type* flip_view = simple_image_copy(m);
+	// the passes ping-pong between two buffers; the first pass reads
+	// the source image directly, every further pass reads the result
+	// of the previous one, so no intermediate copies are needed
+	data_type* flip_data = new data_type(m.size(), m.origin());
+	view_type* flip_view = new view_type(*flip_data);
+	view_type* dst_view = new_view;
+	view_type* spare_view = flip_view;
 	try {
 	  unsigned int r, ngeo = 0;
 	  bool n8;
 	  ngeo = 1;
 	  for (r = 1; r <= times; r++) {
 	    if (r > 1) {
-	      typename view_type::vec_iterator g = flip_view->vec_begin();
-	      typename view_type::vec_iterator h = new_view->vec_begin();
-	      for (; g != flip_view->vec_end(); g++, h++)
-		*g = *h;
+	      view_type* src_view = dst_view;
+	      dst_view = spare_view;
+	      spare_view = src_view;
 	    }
 	    if (geo && (ngeo % 2 == 0))
 	      n8 = true;
 	    else
 	      n8 = false;
 	    if (direction) {
-	      if (n8)
-		neighbor4o(*flip_view, max, *new_view);
-	      else
-		neighbor9(*flip_view, max, *new_view);
+	      if (r == 1) {
+		if (n8)
+		  neighbor4o(m, max, *dst_view);
+		else
+		  neighbor9(m, max, *dst_view);
+	      } else {
+		if (n8)
+		  neighbor4o(*spare_view, max, *dst_view);
+		else
+		  neighbor9(*spare_view, max, *dst_view);
+	      }
 	    }
 	    else {
-	      if (n8)
-		neighbor4o(*flip_view, min, *new_view);
-	      else
-		neighbor9(*flip_view, min, *new_view);
+	      if (r == 1) {
+		if (n8)
+		  neighbor4o(m, min, *dst_view);
+		else
+		  neighbor9(m, min, *dst_view);
+	      } else {
+		if (n8)
+		  neighbor4o(*spare_view, min, *dst_view);
+		else
+		  neighbor9(*spare_view, min, *dst_view);
+	      }
 	    }
 	    ngeo++;
 	  }
@@ -265,9 +347,9 @@ namespace Gamera {
 	  delete flip_view;
 	  throw;
 	}
-	delete flip_view->data();
-	delete flip_view;
-	return new_view;
+	delete spare_view->data();
+	delete spare_view;
+	return dst_view;
       } else {
 	if (direction) {
 	  if (geo)
@@ -290,56 +372,290 @@ namespace Gamera {
     }
   }
   
-  /* implementation for non-onebit images */
+  /* implementation for non-onebit images.
+     For rectangular structuring elements, *times* iterations of a 3x3
+     min (max) filter are the same as a single min (max) filter over a
+     (2*times+1)x(2*times+1) window, so we can use the van Herk/Gil-Werman
+     algorithm from min_max_filter, which only needs three comparisons
+     per pixel regardless of the window size. Only the octagonal case
+     still goes through the iterated neighborhood implementation. */
   template<class T>
-  typename ImageFactory<T>::view_type* erode_dilate(T &m, const size_t times, int direction, int geo){
+  typename ImageFactory<T>::view_type* erode_dilate_separable(T &m, const size_t times, int direction, int geo){
 	typedef typename ImageFactory<T>::view_type view_type;
+	typedef typename T::value_type value_type;
 	view_type* new_view;
-	
+
+	// the fast path is only correct for pixel types where white is the
+	// maximum value: onebit-valued views (Cc, RLE, MlCc, ...) have
+	// white=0 < black, so the raw min/max of min_max_filter and the
+	// white-border fixup below would swap erosion and dilation there;
+	// they keep the original Max/Min neighborhood implementation
+	if (!geo && times >= 1 && white(m) > black(m)) {
+	  unsigned int k = 2*times + 1;
+	  if (m.nrows() >= k && m.ncols() >= k) {
+	    // erode moves towards white, i.e. the max filter (see Max above)
+	    new_view = min_max_filter(m, k, (direction ? 1 : 0));
+	    if (direction) {
+	      // neighbor9 pads the image with white, so pixels whose window
+	      // crosses the image border must take white into account too
+	      value_type whiteval = white(m);
+	      size_t nrows = m.nrows();
+	      size_t ncols = m.ncols();
+	      for (size_t y = 0; y < nrows; y++) {
+	        if (y >= times && y < nrows - times) {
+	          for (size_t x = 0; x < times; x++) {
+	            new_view->set(Point(x, y), std::max(new_view->get(Point(x, y)), whiteval));
+	            new_view->set(Point(ncols-1-x, y), std::max(new_view->get(Point(ncols-1-x, y)), whiteval));
+	          }
+	        } else {
+	          for (size_t x = 0; x < ncols; x++)
+	            new_view->set(Point(x, y), std::max(new_view->get(Point(x, y)), whiteval));
+	        }
+	      }
+	    }
+	    return new_view;
+	  }
+	}
+
 	new_view = erode_dilate_original(m,times,direction,geo);
 	return new_view;
   }
-  
+
+  template<class T>
+  typename ImageFactory<T>::view_type* erode_dilate(T &m, const size_t times, int direction, int geo){
+	return erode_dilate_separable(m,times,direction,geo);
+  }
+
+  /* the single 3x3 step on greyscale and float images runs over the raw
+     image rows with the (possibly SIMD) row kernels from
+     morphology_simd.hpp, which process up to 32 pixels per instruction
+     under AVX2 */
+  template<>
+  ImageFactory<GreyScaleImageView>::view_type* erode_dilate<GreyScaleImageView>(GreyScaleImageView &m, const size_t times, int direction, int geo){
+	if (times == 1 && !geo && m.nrows() >= 3 && m.ncols() >= 3) {
+	  size_t nrows = m.nrows();
+	  size_t ncols = m.ncols();
+	  GreyScaleImageData* dest_data = new GreyScaleImageData(m.size(), m.origin());
+	  GreyScaleImageView* dest = new GreyScaleImageView(*dest_data);
+	  const GreyScalePixel* src_base = m.row_begin().m_iterator;
+	  size_t src_stride = m.data()->stride();
+	  GreyScalePixel* dest_base = dest->row_begin().m_iterator;
+	  size_t dest_stride = dest->data()->stride();
+	  GreyScalePixel whiteval = white(m);
+	  // every output row only depends on source rows, so the row
+	  // kernels can run on all scanlines concurrently; the loop index
+	  // is signed because OpenMP 2.5 (gcc < 4.4) requires it
+#ifdef _OPENMP
+#pragma omp parallel for schedule(static)
+#endif
+	  for (long y = 0; y < (long)nrows; y++) {
+	    const GreyScalePixel* cur = src_base + y*src_stride;
+	    const GreyScalePixel* prev = (y > 0) ? cur - src_stride : cur;
+	    const GreyScalePixel* next = (y < nrows-1) ? cur + src_stride : cur;
+	    GreyScalePixel* out = dest_base + y*dest_stride;
+	    if (direction) {
+	      // erode is the max filter; the outermost pixels see the
+	      // white padding and become white, as in neighbor9
+	      if (y == 0 || y == nrows-1)
+	        std::fill(out, out + ncols, whiteval);
+	      else
+	        max3x3_row_u8(prev, cur, next, out, ncols, whiteval);
+	    }
+	    else {
+	      min3x3_row_u8(prev, cur, next, out, ncols);
+	    }
+	  }
+	  return dest;
+	}
+	return erode_dilate_separable(m,times,direction,geo);
+  }
+
+  template<>
+  ImageFactory<FloatImageView>::view_type* erode_dilate<FloatImageView>(FloatImageView &m, const size_t times, int direction, int geo){
+	if (times == 1 && !geo && m.nrows() >= 3 && m.ncols() >= 3) {
+	  size_t nrows = m.nrows();
+	  size_t ncols = m.ncols();
+	  FloatImageData* dest_data = new FloatImageData(m.size(), m.origin());
+	  FloatImageView* dest = new FloatImageView(*dest_data);
+	  const FloatPixel* src_base = m.row_begin().m_iterator;
+	  size_t src_stride = m.data()->stride();
+	  FloatPixel* dest_base = dest->row_begin().m_iterator;
+	  size_t dest_stride = dest->data()->stride();
+	  FloatPixel whiteval = white(m);
+#ifdef _OPENMP
+#pragma omp parallel for schedule(static)
+#endif
+	  for (long y = 0; y < (long)nrows; y++) {
+	    const FloatPixel* cur = src_base + y*src_stride;
+	    const FloatPixel* prev = (y > 0) ? cur - src_stride : cur;
+	    const FloatPixel* next = (y < nrows-1) ? cur + src_stride : cur;
+	    FloatPixel* out = dest_base + y*dest_stride;
+	    if (direction) {
+	      if (y == 0 || y == nrows-1)
+	        std::fill(out, out + ncols, whiteval);
+	      else
+	        max3x3_row_f64(prev, cur, next, out, ncols, whiteval);
+	    }
+	    else {
+	      min3x3_row_f64(prev, cur, next, out, ncols);
+	    }
+	  }
+	  return dest;
+	}
+	return erode_dilate_separable(m,times,direction,geo);
+  }
+
+  /* one 3x3 erosion or dilation step on a bit-packed onebit image.
+     Each word holds 64 pixels (LSB = leftmost pixel), so the 3x3
+     neighborhood reduces to a handful of bitwise operations per word:
+     the three rows are combined vertically first, then the result is
+     OR-ed (AND-ed) with itself shifted left and right by one pixel,
+     with the carry bit taken from the neighboring word. Pixels outside
+     the image count as white (zero), which matches the white padding
+     of erode/dilate_with_structure. */
+  inline void erode_dilate_packed_pass(const unsigned long long* in,
+				       unsigned long long* out,
+				       unsigned long long* rowbuf,
+				       size_t nrows, size_t nwords,
+				       unsigned long long tailmask,
+				       int direction) {
+    size_t y, w;
+    unsigned long long v, left, right;
+    for (y = 0; y < nrows; y++) {
+      const unsigned long long* cur = in + y*nwords;
+      const unsigned long long* prev = (y > 0) ? cur - nwords : 0;
+      const unsigned long long* next = (y < nrows-1) ? cur + nwords : 0;
+      unsigned long long* o = out + y*nwords;
+      if (direction) {
+	// erode: AND of the nine neighbors, missing rows are white
+	if (!prev || !next) {
+	  for (w = 0; w < nwords; w++)
+	    o[w] = 0;
+	  continue;
+	}
+	for (w = 0; w < nwords; w++)
+	  rowbuf[w] = cur[w] & prev[w] & next[w];
+	for (w = 0; w < nwords; w++) {
+	  v = rowbuf[w];
+	  left = (v << 1) | ((w > 0) ? (rowbuf[w-1] >> 63) : 0);
+	  right = (v >> 1) | ((w < nwords-1) ? (rowbuf[w+1] << 63) : 0);
+	  o[w] = v & left & right;
+	}
+	o[nwords-1] &= tailmask;
+      }
+      else {
+	// dilate: OR of the nine neighbors, missing rows contribute nothing
+	for (w = 0; w < nwords; w++) {
+	  v = cur[w];
+	  if (prev) v |= prev[w];
+	  if (next) v |= next[w];
+	  rowbuf[w] = v;
+	}
+	for (w = 0; w < nwords; w++) {
+	  v = rowbuf[w];
+	  left = (v << 1) | ((w > 0) ? (rowbuf[w-1] >> 63) : 0);
+	  right = (v >> 1) | ((w < nwords-1) ? (rowbuf[w+1] << 63) : 0);
+	  o[w] = v | left | right;
+	}
+	// keep the unused bits behind the last column white, so they
+	// cannot leak back into the image on the next iteration
+	o[nwords-1] &= tailmask;
+      }
+    }
+  }
+
   /* for onebit images the use of erode/dilate_with_structure is much faster
      than the general implementation erode_dilate_original */
+  /* offsets of the octagonal structuring element used by erode_dilate,
+     cached per radius: the octagon is fixed for a given times, so there
+     is no point in regenerating it (let alone as an image) on every
+     call */
+  inline const std::pair<IntVector, IntVector>& octagonal_se_offsets(size_t times) {
+    static std::vector<std::pair<IntVector, IntVector> > cache;
+    if (cache.size() <= times)
+      cache.resize(times + 1);
+    std::pair<IntVector, IntVector>& offsets = cache[times];
+    if (offsets.first.empty()) {
+      int n_corner = (1+(int)times) / 2;
+      int n = 2*(int)times;
+      for (int y = 0; y <= n; y++)
+        for (int x = 0; x <= n; x++)
+          if (!(x+y < n_corner || n-x+y < n_corner ||
+                x+n-y < n_corner || n-x+n-y < n_corner)) {
+            offsets.first.push_back(x - (int)times);
+            offsets.second.push_back(y - (int)times);
+          }
+    }
+    return offsets;
+  }
+
   template<>
   ImageFactory<OneBitImageView>::view_type* erode_dilate<OneBitImageView>(OneBitImageView &src, const size_t times, int direction, int geo){
 
     if (src.nrows() < 3 || src.ncols() < 3 || times < 1)
       return simple_image_copy(src);
 
-    OneBitImageData* se_data = new OneBitImageData(Dim(1+2*times,1+2*times));
-	OneBitImageView* se = new OneBitImageView(*se_data);
-	OneBitImageView* result;
+    // for rectangular structuring elements, work on a bit-packed copy of
+    // the image: 64 pixels are processed per bitwise operation, which
+    // beats the pixelwise erode/dilate_with_structure by a wide margin
+    if (!geo) {
+      size_t nrows = src.nrows();
+      size_t ncols = src.ncols();
+      size_t nwords = (ncols + 63) / 64;
+      unsigned long long tailmask;
+      if (ncols % 64)
+	tailmask = (1ULL << (ncols % 64)) - 1;
+      else
+	tailmask = ~0ULL;
+
+      unsigned long long* packed = new unsigned long long[nrows*nwords];
+      unsigned long long* packed2 = new unsigned long long[nrows*nwords];
+      unsigned long long* rowbuf = new unsigned long long[nwords];
+
+      size_t x, y;
+      for (y = 0; y < nrows; y++) {
+	unsigned long long* row = packed + y*nwords;
+	for (x = 0; x < nwords; x++)
+	  row[x] = 0;
+	for (x = 0; x < ncols; x++)
+	  if (is_black(src.get(Point(x, y))))
+	    row[x / 64] |= 1ULL << (x % 64);
+      }
 
-    // structuring element se depends on the geometry
-	if (geo) {
-      // create octagonal kernel
-      //result = erode_dilate_original(src,times,direction,geo);
-      //return result;
-      int n_corner = (1+(int)times) / 2;
-      int n = (int)se->ncols()-1;
-      for(int y = 0; y < (int)se->nrows(); y++)
-        for(int x = 0; x < (int)se->ncols(); x++)
-          if (!(x+y < n_corner || n-x+y < n_corner ||
-                x+n-y < n_corner || n-x+n-y < n_corner))
-          se->set(Point(x,y),OneBitPixel(1));
-    }
-    else {
-      // create square kernel
-      for(int y = 0; y < (int)se->nrows(); y++)
-        for(int x = 0; x < (int)se->ncols(); x++)
-          se->set(Point(x,y),OneBitPixel(1));
+      for (size_t i = 0; i < times; i++) {
+	erode_dilate_packed_pass(packed, packed2, rowbuf,
+				 nrows, nwords, tailmask, direction);
+	std::swap(packed, packed2);
+      }
+
+      OneBitImageData* dest_data = new OneBitImageData(src.size(), src.origin());
+      OneBitImageView* dest = new OneBitImageView(*dest_data);
+      OneBitPixel blackval = black(src);
+      for (y = 0; y < nrows; y++) {
+	unsigned long long* row = packed + y*nwords;
+	for (x = 0; x < ncols; x++)
+	  if (row[x / 64] & (1ULL << (x % 64)))
+	    dest->set(Point(x, y), blackval);
+      }
+
+      delete[] packed;
+      delete[] packed2;
+      delete[] rowbuf;
+      return dest;
     }
 
+    // octagonal kernel: the structuring element only depends on times,
+    // so its offset list is computed once and reused by later calls,
+    // instead of rebuilding (and rescanning) an SE image per call
+    const std::pair<IntVector, IntVector>& se = octagonal_se_offsets(times);
+    int bound = (int)times;
+
 	if (direction)
-      result = erode_with_structure(src,*se, Point(times,times));
+      return erode_with_offsets(src, se.first, se.second,
+                                bound, bound, bound, bound);
 	else
-      result = dilate_with_structure(src,*se,Point(times,times),false);
-    delete se->data();
-    delete se;
-
-	return result;
+      return dilate_with_offsets(src, se.first, se.second,
+                                 bound, bound, bound, bound, false);
   }
   
   template<class T>
@@ -352,6 +668,187 @@ namespace Gamera {
     erode_dilate(image, 1, 0, 0);
   }
 
+  /* opening = erosion followed by dilation, closing = dilation followed
+     by erosion. The generic version simply runs erode_dilate twice and
+     frees the intermediate image. */
+  template<class T>
+  typename ImageFactory<T>::view_type* open_close_twopass(T &m, const size_t times, int direction_first, int geo) {
+    typename ImageFactory<T>::view_type* tmp = erode_dilate(m, times, direction_first, geo);
+    typename ImageFactory<T>::view_type* result = erode_dilate(*tmp, times, (direction_first ? 0 : 1), geo);
+    delete tmp->data();
+    delete tmp;
+    return result;
+  }
+
+  template<class T>
+  typename ImageFactory<T>::view_type* opening(T &m, const size_t times, int geo) {
+    return open_close_twopass(m, times, 1, geo);
+  }
+
+  template<class T>
+  typename ImageFactory<T>::view_type* closing(T &m, const size_t times, int geo) {
+    return open_close_twopass(m, times, 0, geo);
+  }
+
+  /* fused single-step opening/closing on greyscale and float images:
+     instead of materializing the intermediate image, only a rolling
+     buffer of three intermediate rows is kept, which stays in cache
+     across both phases. The row semantics match the erode_dilate
+     specializations above exactly: eroded border rows are white, and
+     dilation clamps missing neighbor rows to the current row. */
+  template<>
+  ImageFactory<GreyScaleImageView>::view_type* opening<GreyScaleImageView>(GreyScaleImageView &m, const size_t times, int geo) {
+	if (times == 1 && !geo && m.nrows() >= 3 && m.ncols() >= 3) {
+	  size_t nrows = m.nrows();
+	  size_t ncols = m.ncols();
+	  GreyScaleImageData* dest_data = new GreyScaleImageData(m.size(), m.origin());
+	  GreyScaleImageView* dest = new GreyScaleImageView(*dest_data);
+	  const GreyScalePixel* src_base = m.row_begin().m_iterator;
+	  size_t src_stride = m.data()->stride();
+	  GreyScalePixel* dest_base = dest->row_begin().m_iterator;
+	  size_t dest_stride = dest->data()->stride();
+	  GreyScalePixel whiteval = white(m);
+	  GreyScalePixel* ebuf = new GreyScalePixel[3 * ncols];
+	  GreyScalePixel* erow[3] = { ebuf, ebuf + ncols, ebuf + 2*ncols };
+	  // eroded rows 0 and nrows-1 see the white padding and are white
+	  std::fill(erow[0], erow[0] + ncols, whiteval);
+	  const GreyScalePixel* r1 = src_base + src_stride;
+	  max3x3_row_u8(src_base, r1, r1 + src_stride, erow[1], ncols, whiteval);
+	  for (size_t y = 0; y < nrows; y++) {
+	    if (y >= 1 && y + 1 < nrows) {
+	      size_t e = y + 1;
+	      if (e == nrows - 1)
+	        std::fill(erow[e % 3], erow[e % 3] + ncols, whiteval);
+	      else {
+	        const GreyScalePixel* cur = src_base + e*src_stride;
+	        max3x3_row_u8(cur - src_stride, cur, cur + src_stride,
+	                      erow[e % 3], ncols, whiteval);
+	      }
+	    }
+	    const GreyScalePixel* ecur = erow[y % 3];
+	    const GreyScalePixel* eprev = (y > 0) ? erow[(y-1) % 3] : ecur;
+	    const GreyScalePixel* enext = (y < nrows-1) ? erow[(y+1) % 3] : ecur;
+	    min3x3_row_u8(eprev, ecur, enext, dest_base + y*dest_stride, ncols);
+	  }
+	  delete[] ebuf;
+	  return dest;
+	}
+	return open_close_twopass(m, times, 1, geo);
+  }
+
+  template<>
+  ImageFactory<GreyScaleImageView>::view_type* closing<GreyScaleImageView>(GreyScaleImageView &m, const size_t times, int geo) {
+	if (times == 1 && !geo && m.nrows() >= 3 && m.ncols() >= 3) {
+	  size_t nrows = m.nrows();
+	  size_t ncols = m.ncols();
+	  GreyScaleImageData* dest_data = new GreyScaleImageData(m.size(), m.origin());
+	  GreyScaleImageView* dest = new GreyScaleImageView(*dest_data);
+	  const GreyScalePixel* src_base = m.row_begin().m_iterator;
+	  size_t src_stride = m.data()->stride();
+	  GreyScalePixel* dest_base = dest->row_begin().m_iterator;
+	  size_t dest_stride = dest->data()->stride();
+	  GreyScalePixel whiteval = white(m);
+	  GreyScalePixel* dbuf = new GreyScalePixel[3 * ncols];
+	  GreyScalePixel* drow[3] = { dbuf, dbuf + ncols, dbuf + 2*ncols };
+	  const GreyScalePixel* r1 = src_base + src_stride;
+	  min3x3_row_u8(src_base, src_base, r1, drow[0], ncols);
+	  min3x3_row_u8(src_base, r1, r1 + src_stride, drow[1], ncols);
+	  for (size_t y = 0; y < nrows; y++) {
+	    if (y >= 1 && y + 1 < nrows) {
+	      size_t d = y + 1;
+	      const GreyScalePixel* cur = src_base + d*src_stride;
+	      const GreyScalePixel* next = (d < nrows-1) ? cur + src_stride : cur;
+	      min3x3_row_u8(cur - src_stride, cur, next, drow[d % 3], ncols);
+	    }
+	    GreyScalePixel* out = dest_base + y*dest_stride;
+	    if (y == 0 || y == nrows-1)
+	      std::fill(out, out + ncols, whiteval);
+	    else
+	      max3x3_row_u8(drow[(y-1) % 3], drow[y % 3], drow[(y+1) % 3],
+	                    out, ncols, whiteval);
+	  }
+	  delete[] dbuf;
+	  return dest;
+	}
+	return open_close_twopass(m, times, 0, geo);
+  }
+
+  template<>
+  ImageFactory<FloatImageView>::view_type* opening<FloatImageView>(FloatImageView &m, const size_t times, int geo) {
+	if (times == 1 && !geo && m.nrows() >= 3 && m.ncols() >= 3) {
+	  size_t nrows = m.nrows();
+	  size_t ncols = m.ncols();
+	  FloatImageData* dest_data = new FloatImageData(m.size(), m.origin());
+	  FloatImageView* dest = new FloatImageView(*dest_data);
+	  const FloatPixel* src_base = m.row_begin().m_iterator;
+	  size_t src_stride = m.data()->stride();
+	  FloatPixel* dest_base = dest->row_begin().m_iterator;
+	  size_t dest_stride = dest->data()->stride();
+	  FloatPixel whiteval = white(m);
+	  FloatPixel* ebuf = new FloatPixel[3 * ncols];
+	  FloatPixel* erow[3] = { ebuf, ebuf + ncols, ebuf + 2*ncols };
+	  std::fill(erow[0], erow[0] + ncols, whiteval);
+	  const FloatPixel* r1 = src_base + src_stride;
+	  max3x3_row_f64(src_base, r1, r1 + src_stride, erow[1], ncols, whiteval);
+	  for (size_t y = 0; y < nrows; y++) {
+	    if (y >= 1 && y + 1 < nrows) {
+	      size_t e = y + 1;
+	      if (e == nrows - 1)
+	        std::fill(erow[e % 3], erow[e % 3] + ncols, whiteval);
+	      else {
+	        const FloatPixel* cur = src_base + e*src_stride;
+	        max3x3_row_f64(cur - src_stride, cur, cur + src_stride,
+	                       erow[e % 3], ncols, whiteval);
+	      }
+	    }
+	    const FloatPixel* ecur = erow[y % 3];
+	    const FloatPixel* eprev = (y > 0) ? erow[(y-1) % 3] : ecur;
+	    const FloatPixel* enext = (y < nrows-1) ? erow[(y+1) % 3] : ecur;
+	    min3x3_row_f64(eprev, ecur, enext, dest_base + y*dest_stride, ncols);
+	  }
+	  delete[] ebuf;
+	  return dest;
+	}
+	return open_close_twopass(m, times, 1, geo);
+  }
+
+  template<>
+  ImageFactory<FloatImageView>::view_type* closing<FloatImageView>(FloatImageView &m, const size_t times, int geo) {
+	if (times == 1 && !geo && m.nrows() >= 3 && m.ncols() >= 3) {
+	  size_t nrows = m.nrows();
+	  size_t ncols = m.ncols();
+	  FloatImageData* dest_data = new FloatImageData(m.size(), m.origin());
+	  FloatImageView* dest = new FloatImageView(*dest_data);
+	  const FloatPixel* src_base = m.row_begin().m_iterator;
+	  size_t src_stride = m.data()->stride();
+	  FloatPixel* dest_base = dest->row_begin().m_iterator;
+	  size_t dest_stride = dest->data()->stride();
+	  FloatPixel whiteval = white(m);
+	  FloatPixel* dbuf = new FloatPixel[3 * ncols];
+	  FloatPixel* drow[3] = { dbuf, dbuf + ncols, dbuf + 2*ncols };
+	  const FloatPixel* r1 = src_base + src_stride;
+	  min3x3_row_f64(src_base, src_base, r1, drow[0], ncols);
+	  min3x3_row_f64(src_base, r1, r1 + src_stride, drow[1], ncols);
+	  for (size_t y = 0; y < nrows; y++) {
+	    if (y >= 1 && y + 1 < nrows) {
+	      size_t d = y + 1;
+	      const FloatPixel* cur = src_base + d*src_stride;
+	      const FloatPixel* next = (d < nrows-1) ? cur + src_stride : cur;
+	      min3x3_row_f64(cur - src_stride, cur, next, drow[d % 3], ncols);
+	    }
+	    FloatPixel* out = dest_base + y*dest_stride;
+	    if (y == 0 || y == nrows-1)
+	      std::fill(out, out + ncols, whiteval);
+	    else
+	      max3x3_row_f64(drow[(y-1) % 3], drow[y % 3], drow[(y+1) % 3],
+	                     out, ncols, whiteval);
+	  }
+	  delete[] dbuf;
+	  return dest;
+	}
+	return open_close_twopass(m, times, 0, geo);
+  }
+
   template<class T>
   class Mode {
   public:
@@ -0,0 +1,175 @@
+/*
+ * Copyright (C) 2001-2012 Ichiro Fujinaga, Michael Droettboom, and Karl MacMillan
+ *
+ * This program is free software; you can redistribute it and/or
+ * modify it under the terms of the GNU General Public License
+ * as published by the Free Software Foundation; either version 2
+ * of the License, or (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+ */
+
+/* Row kernels for the 3x3 min/max (dilation/erosion) on raw, contiguous
+   image rows. When the compiler targets AVX2 (-march with AVX2 support),
+   the 8-bit kernels process 32 pixels and the double kernels 4 pixels
+   per instruction; otherwise a plain scalar loop is compiled, which
+   recent compilers can still autovectorize. The caller is responsible
+   for the first and last image row (for the max filter these are
+   entirely white, for the min filter the missing row can simply be
+   passed twice, since white is the neutral element of min). */
+
+#ifndef cb30082012_morphology_simd
+#define cb30082012_morphology_simd
+
+#include <algorithm>
+
+#if defined(__AVX2__)
+#include <immintrin.h>
+#endif
+
+namespace Gamera {
+
+  /* out[x] = min of the 3x3 window around x over the rows r0, r1, r2.
+     The pixels left of x=0 and right of x=w-1 count as white, which is
+     the neutral element of min, so they are simply left out. */
+  inline void min3x3_row_u8(const unsigned char* r0, const unsigned char* r1,
+			    const unsigned char* r2, unsigned char* out,
+			    size_t w) {
+    size_t x = 1;
+    out[0] = std::min(std::min(std::min(r0[0], r0[1]),
+			       std::min(r1[0], r1[1])),
+		      std::min(r2[0], r2[1]));
+#if defined(__AVX2__)
+    for (; x + 32 <= w - 1; x += 32) {
+      __m256i m0 = _mm256_min_epu8(
+	  _mm256_min_epu8(_mm256_loadu_si256((const __m256i*)(r0+x-1)),
+			  _mm256_loadu_si256((const __m256i*)(r0+x))),
+	  _mm256_loadu_si256((const __m256i*)(r0+x+1)));
+      __m256i m1 = _mm256_min_epu8(
+	  _mm256_min_epu8(_mm256_loadu_si256((const __m256i*)(r1+x-1)),
+			  _mm256_loadu_si256((const __m256i*)(r1+x))),
+	  _mm256_loadu_si256((const __m256i*)(r1+x+1)));
+      __m256i m2 = _mm256_min_epu8(
+	  _mm256_min_epu8(_mm256_loadu_si256((const __m256i*)(r2+x-1)),
+			  _mm256_loadu_si256((const __m256i*)(r2+x))),
+	  _mm256_loadu_si256((const __m256i*)(r2+x+1)));
+      _mm256_storeu_si256((__m256i*)(out+x),
+			  _mm256_min_epu8(_mm256_min_epu8(m0, m1), m2));
+    }
+#endif
+    for (; x < w - 1; x++) {
+      unsigned char m0 = std::min(std::min(r0[x-1], r0[x]), r0[x+1]);
+      unsigned char m1 = std::min(std::min(r1[x-1], r1[x]), r1[x+1]);
+      unsigned char m2 = std::min(std::min(r2[x-1], r2[x]), r2[x+1]);
+      out[x] = std::min(std::min(m0, m1), m2);
+    }
+    out[w-1] = std::min(std::min(std::min(r0[w-2], r0[w-1]),
+				 std::min(r1[w-2], r1[w-1])),
+			std::min(r2[w-2], r2[w-1]));
+  }
+
+  /* out[x] = max of the 3x3 window around x over the rows r0, r1, r2.
+     The pixels outside the row count as white, so the first and last
+     pixel become white, like in neighbor9. */
+  inline void max3x3_row_u8(const unsigned char* r0, const unsigned char* r1,
+			    const unsigned char* r2, unsigned char* out,
+			    size_t w, unsigned char whiteval) {
+    size_t x = 1;
+    out[0] = whiteval;
+#if defined(__AVX2__)
+    for (; x + 32 <= w - 1; x += 32) {
+      __m256i m0 = _mm256_max_epu8(
+	  _mm256_max_epu8(_mm256_loadu_si256((const __m256i*)(r0+x-1)),
+			  _mm256_loadu_si256((const __m256i*)(r0+x))),
+	  _mm256_loadu_si256((const __m256i*)(r0+x+1)));
+      __m256i m1 = _mm256_max_epu8(
+	  _mm256_max_epu8(_mm256_loadu_si256((const __m256i*)(r1+x-1)),
+			  _mm256_loadu_si256((const __m256i*)(r1+x))),
+	  _mm256_loadu_si256((const __m256i*)(r1+x+1)));
+      __m256i m2 = _mm256_max_epu8(
+	  _mm256_max_epu8(_mm256_loadu_si256((const __m256i*)(r2+x-1)),
+			  _mm256_loadu_si256((const __m256i*)(r2+x))),
+	  _mm256_loadu_si256((const __m256i*)(r2+x+1)));
+      _mm256_storeu_si256((__m256i*)(out+x),
+			  _mm256_max_epu8(_mm256_max_epu8(m0, m1), m2));
+    }
+#endif
+    for (; x < w - 1; x++) {
+      unsigned char m0 = std::max(std::max(r0[x-1], r0[x]), r0[x+1]);
+      unsigned char m1 = std::max(std::max(r1[x-1], r1[x]), r1[x+1]);
+      unsigned char m2 = std::max(std::max(r2[x-1], r2[x]), r2[x+1]);
+      out[x] = std::max(std::max(m0, m1), m2);
+    }
+    out[w-1] = whiteval;
+  }
+
+  /* the same two kernels for float (i.e. double) images */
+  inline void min3x3_row_f64(const double* r0, const double* r1,
+			     const double* r2, double* out, size_t w) {
+    size_t x = 1;
+    out[0] = std::min(std::min(std::min(r0[0], r0[1]),
+			       std::min(r1[0], r1[1])),
+		      std::min(r2[0], r2[1]));
+#if defined(__AVX2__)
+    for (; x + 4 <= w - 1; x += 4) {
+      __m256d m0 = _mm256_min_pd(_mm256_min_pd(_mm256_loadu_pd(r0+x-1),
+					       _mm256_loadu_pd(r0+x)),
+				 _mm256_loadu_pd(r0+x+1));
+      __m256d m1 = _mm256_min_pd(_mm256_min_pd(_mm256_loadu_pd(r1+x-1),
+					       _mm256_loadu_pd(r1+x)),
+				 _mm256_loadu_pd(r1+x+1));
+      __m256d m2 = _mm256_min_pd(_mm256_min_pd(_mm256_loadu_pd(r2+x-1),
+					       _mm256_loadu_pd(r2+x)),
+				 _mm256_loadu_pd(r2+x+1));
+      _mm256_storeu_pd(out+x, _mm256_min_pd(_mm256_min_pd(m0, m1), m2));
+    }
+#endif
+    for (; x < w - 1; x++) {
+      double m0 = std::min(std::min(r0[x-1], r0[x]), r0[x+1]);
+      double m1 = std::min(std::min(r1[x-1], r1[x]), r1[x+1]);
+      double m2 = std::min(std::min(r2[x-1], r2[x]), r2[x+1]);
+      out[x] = std::min(std::min(m0, m1), m2);
+    }
+    out[w-1] = std::min(std::min(std::min(r0[w-2], r0[w-1]),
+				 std::min(r1[w-2], r1[w-1])),
+			std::min(r2[w-2], r2[w-1]));
+  }
+
+  inline void max3x3_row_f64(const double* r0, const double* r1,
+			     const double* r2, double* out, size_t w,
+			     double whiteval) {
+    size_t x = 1;
+    out[0] = whiteval;
+#if defined(__AVX2__)
+    for (; x + 4 <= w - 1; x += 4) {
+      __m256d m0 = _mm256_max_pd(_mm256_max_pd(_mm256_loadu_pd(r0+x-1),
+					       _mm256_loadu_pd(r0+x)),
+				 _mm256_loadu_pd(r0+x+1));
+      __m256d m1 = _mm256_max_pd(_mm256_max_pd(_mm256_loadu_pd(r1+x-1),
+					       _mm256_loadu_pd(r1+x)),
+				 _mm256_loadu_pd(r1+x+1));
+      __m256d m2 = _mm256_max_pd(_mm256_max_pd(_mm256_loadu_pd(r2+x-1),
+					       _mm256_loadu_pd(r2+x)),
+				 _mm256_loadu_pd(r2+x+1));
+      _mm256_storeu_pd(out+x, _mm256_max_pd(_mm256_max_pd(m0, m1), m2));
+    }
+#endif
+    for (; x < w - 1; x++) {
+      double m0 = std::max(std::max(r0[x-1], r0[x]), r0[x+1]);
+      double m1 = std::max(std::max(r1[x-1], r1[x]), r1[x+1]);
+      double m2 = std::max(std::max(r2[x-1], r2[x]), r2[x+1]);
+      out[x] = std::max(std::max(m0, m1), m2);
+    }
+    out[w-1] = whiteval;
+  }
+
+}
+
+#endif
@@ -69,6 +69,170 @@ bool fill_image_from_string(T &image, PyObject* data_string) {
   return true;
 }
 
+template <class T>
+bool fill_image_from_buffer(T &image, const Py_buffer &buffer) {
+  typedef typename T::value_type value_type;
+  size_t image_size = image.ncols() * image.nrows() * sizeof(value_type);
+  if ((size_t)buffer.len != image_size) {
+    if ((size_t)buffer.len > image_size) {
+      PyErr_SetString(PyExc_ValueError,
+		      "buffer too long for image");
+    } else {
+      PyErr_SetString(PyExc_ValueError,
+		      "buffer too short for image");
+    }
+    return false;
+  }
+  typename T::vec_iterator i = image.vec_begin();
+  value_type* j = (value_type*)buffer.buf;
+  for (; i != image.vec_end(); ++i, ++j) {
+    *i = *j;
+  }
+  return true;
+}
+
+/* like _from_raw_string, but reads the pixel data directly through the
+   buffer protocol, so the caller does not need to materialize an
+   intermediate string copy of the data first */
+Image* _from_raw_buffer(Point offset, Dim size,
+			int pixel_type, int storage_format,
+			PyObject* buffer_object) {
+  Py_buffer buffer;
+  if (PyObject_GetBuffer(buffer_object, &buffer, PyBUF_CONTIG_RO) < 0)
+    return NULL;
+  Image* result = NULL;
+  if (pixel_type == ONEBIT && storage_format == RLE) {
+    typedef TypeIdImageFactory<ONEBIT, RLE> factory;
+    factory::image_type* image = factory::create(offset, size);
+    if (fill_image_from_buffer(*image, buffer))
+      result = image;
+  } else if (pixel_type == ONEBIT && storage_format == DENSE) {
+    typedef TypeIdImageFactory<ONEBIT, DENSE> factory;
+    factory::image_type* image = factory::create(offset, size);
+    if (fill_image_from_buffer(*image, buffer))
+      result = image;
+  } else if (pixel_type == GREYSCALE) {
+    typedef TypeIdImageFactory<GREYSCALE, DENSE> factory;
+    factory::image_type* image = factory::create(offset, size);
+    if (fill_image_from_buffer(*image, buffer))
+      result = image;
+  } else if (pixel_type == GREY16) {
+    typedef TypeIdImageFactory<GREY16, DENSE> factory;
+    factory::image_type* image = factory::create(offset, size);
+    if (fill_image_from_buffer(*image, buffer))
+      result = image;
+  } else if (pixel_type == RGB) {
+    typedef TypeIdImageFactory<RGB, DENSE> factory;
+    factory::image_type* image = factory::create(offset, size);
+    if (fill_image_from_buffer(*image, buffer))
+      result = image;
+  } else if (pixel_type == FLOAT) {
+    typedef TypeIdImageFactory<FLOAT, DENSE> factory;
+    factory::image_type* image = factory::create(offset, size);
+    if (fill_image_from_buffer(*image, buffer))
+      result = image;
+  } else if (pixel_type == COMPLEX) {
+    typedef TypeIdImageFactory<COMPLEX, DENSE> factory;
+    factory::image_type* image = factory::create(offset, size);
+    if (fill_image_from_buffer(*image, buffer))
+      result = image;
+  } else {
+    PyErr_SetString(PyExc_ValueError, "Invalid pixel_type or storage_format");
+  }
+  PyBuffer_Release(&buffer);
+  return result;
+}
+
+/* like _to_raw_string, but copies the pixel data into a writable
+   buffer supplied by the caller (e.g. a preallocated bytearray), so
+   repeated conversions can reuse one allocation instead of creating a
+   fresh string per call. Returns the buffer object itself. */
+template<class T>
+PyObject* _to_raw_buffer(const T &image, PyObject* buffer_object) {
+  typedef typename T::value_type value_type;
+  Py_buffer buffer;
+  if (PyObject_GetBuffer(buffer_object, &buffer, PyBUF_CONTIG) < 0)
+    return NULL;
+  size_t image_size = image.ncols() * image.nrows() * sizeof(value_type);
+  if ((size_t)buffer.len != image_size) {
+    if ((size_t)buffer.len > image_size) {
+      PyErr_SetString(PyExc_ValueError,
+		      "buffer too long for image");
+    } else {
+      PyErr_SetString(PyExc_ValueError,
+		      "buffer too short for image");
+    }
+    PyBuffer_Release(&buffer);
+    return NULL;
+  }
+  typename T::const_vec_iterator j = image.vec_begin();
+  value_type* i = (value_type*)buffer.buf;
+  for (; j != image.vec_end(); ++i, ++j) {
+    *i = *j;
+  }
+  PyBuffer_Release(&buffer);
+  Py_INCREF(buffer_object);
+  return buffer_object;
+}
+
+/* Returns a memoryview over the image's pixel buffer, without copying.
+   This is only possible for dense images whose view covers contiguous
+   rows; for anything else a TypeError is raised and the caller should
+   fall back to _to_raw_string. The memoryview does not own the pixel
+   data, so the caller must copy out of it while the image is alive. */
+template<class T>
+PyObject* _image_as_buffer(T &image) {
+  PyErr_SetString(PyExc_TypeError,
+		  "image storage does not support direct buffer access");
+  return NULL;
+}
+
+template<class T>
+PyObject* dense_image_as_buffer(T &image) {
+  typedef typename T::value_type value_type;
+  if (image.ncols() != image.data()->stride()) {
+    PyErr_SetString(PyExc_TypeError,
+		    "image rows are not contiguous in memory");
+    return NULL;
+  }
+  Py_buffer buffer;
+  if (PyBuffer_FillInfo(&buffer, NULL, (void*)image.row_begin().m_iterator,
+			image.ncols() * image.nrows() * sizeof(value_type),
+			1, PyBUF_CONTIG_RO) < 0)
+    return NULL;
+  return PyMemoryView_FromBuffer(&buffer);
+}
+
+template<>
+PyObject* _image_as_buffer(OneBitImageView &image) {
+  return dense_image_as_buffer(image);
+}
+
+template<>
+PyObject* _image_as_buffer(GreyScaleImageView &image) {
+  return dense_image_as_buffer(image);
+}
+
+template<>
+PyObject* _image_as_buffer(Grey16ImageView &image) {
+  return dense_image_as_buffer(image);
+}
+
+template<>
+PyObject* _image_as_buffer(RGBImageView &image) {
+  return dense_image_as_buffer(image);
+}
+
+template<>
+PyObject* _image_as_buffer(FloatImageView &image) {
+  return dense_image_as_buffer(image);
+}
+
+template<>
+PyObject* _image_as_buffer(ComplexImageView &image) {
+  return dense_image_as_buffer(image);
+}
+
 Image* _from_raw_string(Point offset, Dim size,
 			int pixel_type, int storage_format,
 			PyObject* data_string) {
@@ -27,6 +27,8 @@
 #include <exception>
 #include <stdexcept>
 #include <bitset>
+#include <cstring>
+#include <algorithm>
 
 namespace Gamera {
 
@@ -88,16 +90,98 @@ ImageInfo* tiff_info(const char* filename) {
 }
 namespace {
 
+  /*
+    Reads TIFF image data one whole strip (or row of tiles) at a time
+    and hands out pointers to individual scanlines within the decoded
+    chunk.  Decoding strip-wise avoids the per-row call and setup
+    overhead of TIFFReadScanline, and also makes tiled TIFFs loadable
+    through the same scanline interface.  Scanlines must be requested
+    in increasing order, since earlier chunks are not kept around.
+  */
+  class tiff_chunk_reader {
+  public:
+    tiff_chunk_reader(TIFF* tif) : m_tif(tif) {
+      m_scanline_size = TIFFScanlineSize(tif);
+      m_tile_buf = 0;
+      m_tile_width = 0;
+      TIFFGetFieldDefaulted(tif, TIFFTAG_IMAGELENGTH, &m_nrows);
+      TIFFGetFieldDefaulted(tif, TIFFTAG_IMAGEWIDTH, &m_ncols);
+      if (TIFFIsTiled(tif)) {
+        TIFFGetField(tif, TIFFTAG_TILELENGTH, &m_chunk_rows);
+        TIFFGetField(tif, TIFFTAG_TILEWIDTH, &m_tile_width);
+        m_tile_buf = _TIFFmalloc(TIFFTileSize(tif));
+        if (m_tile_buf == NULL)
+          throw std::runtime_error("Error allocating scanline");
+      } else {
+        // RowsPerStrip defaults to "infinity" ((uint32)-1), meaning the
+        // whole image is one strip; clamp so the buffer size stays sane
+        TIFFGetFieldDefaulted(tif, TIFFTAG_ROWSPERSTRIP, &m_chunk_rows);
+        m_chunk_rows = std::min(m_chunk_rows, m_nrows);
+      }
+      unsigned short bits, samples;
+      TIFFGetFieldDefaulted(tif, TIFFTAG_BITSPERSAMPLE, &bits);
+      TIFFGetFieldDefaulted(tif, TIFFTAG_SAMPLESPERPIXEL, &samples);
+      m_bits_per_pixel = (size_t)bits * samples;
+      m_buf = _TIFFmalloc(m_scanline_size * m_chunk_rows);
+      if (m_buf == NULL) {
+        if (m_tile_buf)
+          _TIFFfree(m_tile_buf);
+        throw std::runtime_error("Error allocating scanline");
+      }
+      m_first_row = m_rows_in_chunk = 0;
+    }
+    ~tiff_chunk_reader() {
+      _TIFFfree(m_buf);
+      if (m_tile_buf)
+        _TIFFfree(m_tile_buf);
+    }
+    char* scanline(size_t row) {
+      if (row >= m_first_row + m_rows_in_chunk)
+        load_chunk(row);
+      return (char*)m_buf + (row - m_first_row) * m_scanline_size;
+    }
+  private:
+    void load_chunk(size_t row) {
+      size_t chunk = row / m_chunk_rows;
+      m_first_row = chunk * m_chunk_rows;
+      m_rows_in_chunk = std::min((size_t)m_chunk_rows,
+                                 (size_t)m_nrows - m_first_row);
+      if (m_tile_buf) {
+        // assemble full scanlines from the row of tiles covering
+        // this chunk (tile widths are multiples of 16, so the
+        // per-tile byte offsets are whole bytes even for onebit)
+        tsize_t tile_row_size = TIFFTileRowSize(m_tif);
+        for (uint32 x = 0; x < m_ncols; x += m_tile_width) {
+          TIFFReadTile(m_tif, m_tile_buf, x, (uint32)m_first_row, 0, 0);
+          size_t offset = ((size_t)x * m_bits_per_pixel) / 8;
+          size_t bytes = std::min((size_t)tile_row_size,
+                                  (size_t)m_scanline_size - offset);
+          for (size_t r = 0; r < m_rows_in_chunk; ++r)
+            std::memcpy((char*)m_buf + r * m_scanline_size + offset,
+                        (char*)m_tile_buf + r * tile_row_size, bytes);
+        }
+      } else {
+        // decode the whole strip in a single call
+        TIFFReadEncodedStrip(m_tif, (tstrip_t)chunk, m_buf,
+                             m_rows_in_chunk * m_scanline_size);
+      }
+    }
+    TIFF* m_tif;
+    tdata_t m_buf, m_tile_buf;
+    tsize_t m_scanline_size;
+    uint32 m_chunk_rows, m_tile_width, m_nrows, m_ncols;
+    size_t m_first_row, m_rows_in_chunk, m_bits_per_pixel;
+  };
+
   template<class T>
   void tiff_load_onebit(T& matrix, ImageInfo& info, const char* filename) {
     // open the image
     TIFF* tif = TIFFOpen(filename, "r");
-    tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
-    
+    tiff_chunk_reader reader(tif);
+
     // load the data
     for (size_t i = 0; i < info.nrows(); i++) {
-      TIFFReadScanline(tif, buf, i);
-      char* data = (char *)buf;
+      char* data = reader.scanline(i);
       std::bitset<8> bits;
       int tmp;
       for (size_t j = 0, k = 7, bit_index = 0; j < info.ncols(); j++, k--) {
@@ -115,7 +199,6 @@ namespace {
       }
     }
     // do the cleanup
-    _TIFFfree(buf);
     TIFFClose(tif);
   }
 
@@ -123,16 +206,15 @@ namespace {
   void tiff_load_greyscale(T& matrix, ImageInfo& info, const char* filename) {
     // open the image
     TIFF* tif = TIFFOpen(filename, "r");
-    tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
-    
+    tiff_chunk_reader reader(tif);
+
     typename T::row_iterator mi = matrix.row_begin();
     typename T::col_iterator mj;
     unsigned char* data;
     if (info.inverted()) {
       for (size_t i = 0; i < info.nrows(); i++, mi++) {
         mj = mi.begin();
-        TIFFReadScanline(tif, buf, i);
-        data = (unsigned char *)buf;
+        data = (unsigned char *)reader.scanline(i);
         for (size_t j = 0; j < info.ncols(); j++, mj++) {
           *mj = 255 - data[j];
         }
@@ -140,16 +222,14 @@ namespace {
     } else {
       for (size_t i = 0; i < info.nrows(); i++, mi++) {
         mj = mi.begin();
-        TIFFReadScanline(tif, buf, i);
-        data = (unsigned char *)buf;
+        data = (unsigned char *)reader.scanline(i);
         for (size_t j = 0; j < info.ncols(); j++, mj++) {
           *mj = data[j];
         }
       }
     }
-    
+
     // do the cleanup
-    _TIFFfree(buf);
     TIFFClose(tif);
   }
 
@@ -157,22 +237,20 @@ namespace {
   void tiff_load_grey16(T& matrix, ImageInfo& info, const char* filename) {
     // open the image
     TIFF* tif = TIFFOpen(filename, "r");
-    tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
-    
+    tiff_chunk_reader reader(tif);
+
     typename T::row_iterator mi = matrix.row_begin();
     typename T::col_iterator mj;
     unsigned short* data;
     for (size_t i = 0; i < info.nrows(); i++, mi++) {
       mj = mi.begin();
-      TIFFReadScanline(tif, buf, i);
-      data = (unsigned short *)buf;
+      data = (unsigned short *)reader.scanline(i);
       for (size_t j = 0; j < info.ncols(); j++, mj++) {
         *mj = data[j];
       }
     }
-    
+
     // do the cleanup
-    _TIFFfree(buf);
     TIFFClose(tif);
   }
 
@@ -180,15 +258,14 @@ namespace {
   void tiff_load_rgb(T& matrix, ImageInfo& info, const char* filename) {
     // open the image
     TIFF* tif = TIFFOpen(filename, "r");
-    tdata_t buf = _TIFFmalloc(TIFFScanlineSize(tif));
-    
+    tiff_chunk_reader reader(tif);
+
     typename T::row_iterator mi = matrix.row_begin();
     typename T::col_iterator mj;
     unsigned char* data;
     for (size_t i = 0; i < info.nrows(); i++, mi++) {
       mj = mi.begin();
-      TIFFReadScanline(tif, buf, i);
-      data = (unsigned char *)buf;
+      data = (unsigned char *)reader.scanline(i);
       for (size_t j = 0; j < info.ncols() * 3; j += 3, mj++) {
         (*mj).red(data[j]);
         (*mj).green(data[j + 1]);
@@ -196,7 +273,6 @@ namespace {
       }
     }
     // do the cleanup
-    _TIFFfree(buf);
     TIFFClose(tif);
   }
 
@@ -0,0 +1,33 @@
+from gamera.core import *
+init_gamera()
+
+# regression tests for erode/dilate polarity: onebit images store
+# white as 0 and black as 1, so a raw min/max filter without the
+# Max/Min pixel functors would swap erosion and dilation.  This bit a
+# previous optimization for the non-dense onebit view types (Cc, RLE),
+# which do not go through the bit-packed specialization.
+
+def _lone_pixel(storage=DENSE, label=1):
+   img = Image((0, 0), (8, 8), ONEBIT, storage)
+   img.set((4, 4), label)
+   return img
+
+def test_erode_dilate_onebit():
+   img = _lone_pixel()
+   assert img.dilate().black_area()[0] == 9.0
+   assert img.erode().black_area()[0] == 0.0
+   assert img.erode_dilate(2, 0, 0).black_area()[0] == 25.0
+
+def test_erode_dilate_cc():
+   img = _lone_pixel(label=2)
+   cc = Cc(img, 2, (0, 0), (8, 8))
+   assert cc.dilate().black_area()[0] == 9.0
+   assert cc.erode().black_area()[0] == 0.0
+   # opening/closing compose erode_dilate and inherit its polarity
+   assert cc.opening().black_area()[0] == 0.0
+   assert cc.closing().black_area()[0] == 1.0
+
+def test_erode_dilate_rle():
+   img = _lone_pixel(RLE)
+   assert img.dilate().black_area()[0] == 9.0
+   assert img.erode().black_area()[0] == 0.0